@@ -3,48 +3,20 @@
 # Run with: streamlit run Home.py
 
 import streamlit as st
+import numpy as np
 import pandas as pd
-import io
+import pyarrow as pa
+import hashlib
 from datetime import datetime
 import os
 
+from utils.style import inject_css
+from core.database import (
+    apply_exchange_deltas, exchange_delta_path, normalize_mixed_columns,
+    parse_workbook, read_parquet_sidecar, write_parquet_sidecar
+)
 
 
-
-# CUSTOM CSS
-st.markdown("""
-<style>
-    .main-header {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 20px;
-        border-radius: 10px;
-        text-align: center;
-        margin-bottom: 30px;
-    }
-    .section-header {
-        color: #444;
-        border-bottom: 2px solid #667eea;
-        padding-bottom: 5px;
-        margin-bottom: 15px;
-    }
-    .success-box {
-        padding: 10px;
-        background-color: #d4edda;
-        border: 1px solid #c3e6cb;
-        border-radius: 5px;
-        margin: 10px 0;
-    }
-    .error-box {
-        padding: 10px;
-        background-color: #f8d7da;
-        border: 1px solid #f5c6cb;
-        border-radius: 5px;
-        margin: 10px 0;
-    }
-</style>
-""", unsafe_allow_html=True)
-
 #HEADER
 # Page config
 st.set_page_config(
@@ -53,6 +25,8 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+# CUSTOM CSS
+inject_css()
 # Main dashboard
 st.markdown('<div class="main-header"><h1>📊 California Prisoner Outreach Program</h1><p>Secure data management with OCR integration</p></div>', unsafe_allow_html=True)
 
@@ -66,13 +40,72 @@ DISPLAY_COLUMNS = [
     'letter exchange (received only)', 'Step (received only)'
 ]
 
+# Column intersection depends only on column names, so it is shared across sessions
+@st.cache_resource
+def existing_display_columns(df_columns, columns):
+    """Return (as an immutable tuple) the requested columns present in df_columns"""
+    df_columns_set = set(df_columns)
+    return tuple(col for col in columns if col in df_columns_set)
+
 # Helper function to filter dataframe columns for display
 # This function preserves the original dataframe while showing only selected columns
 # It also handles cases where some columns might not exist in the dataframe
 def filter_display_columns(df, columns):
     """Filter dataframe to show only specified columns that exist in the dataframe"""
-    existing_columns = [col for col in columns if col in df.columns]
-    return df[existing_columns] if existing_columns else df
+    existing_columns = existing_display_columns(tuple(df.columns), tuple(columns))
+    return df[list(existing_columns)] if existing_columns else df
+
+# Active-sponsee aggregates only change when the data does, not on every widget rerun
+@st.cache_data
+def compute_active_summary(df):
+    """Return the record/sponsor counts and per-sponsor lookups as one memoized stats dict"""
+    # One shared Stage == 12 mask; only the Sponsor column of active rows is materialized
+    stage12_mask = df['Stage'].eq(12).to_numpy(dtype=bool, na_value=False)
+    active_positions = np.flatnonzero(stage12_mask)
+    active_sponsors = df['Sponsor'].iloc[active_positions]
+
+    # observed=True counts only sponsors present in active rows (not every category)
+    sponsor_groups = active_sponsors.groupby(active_sponsors, observed=True, sort=False)
+    sponsor_counts = sponsor_groups.size().sort_values(ascending=False).rename("Active Sponsees")
+    return {
+        'n': len(df),
+        'n_sponsors': active_sponsors.nunique(),
+        'active_n': len(active_positions),
+        'eligible_sponsors': active_sponsors.dropna().unique(),
+        'sponsor_counts': sponsor_counts,
+        # Sponsor -> positional rows in df, so selectbox changes skip a full scan
+        'sponsor_rows': {sponsor: active_positions[idx] for sponsor, idx in sponsor_groups.indices.items()}
+    }
+
+# Arrow table of the display columns, built once per data change; the slider slices it zero-copy
+@st.cache_data
+def build_preview_table(df):
+    preview_df = filter_display_columns(df, DISPLAY_COLUMNS)
+    try:
+        return pa.Table.from_pandas(preview_df)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns (e.g. CDCRno); store them as text
+        object_cols = preview_df.select_dtypes('object').columns
+        return pa.Table.from_pandas(preview_df.astype({col: str for col in object_cols}))
+
+@st.cache_data
+def compute_summary_stats(df):
+    """Per-column dtype, non-null and unique counts; describe() only for numeric columns"""
+    summary = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'non_null': df.count(),
+        'n_unique': df.nunique()
+    })
+    numeric_df = df.select_dtypes('number')
+    if not numeric_df.empty:
+        summary = summary.join(numeric_df.describe().transpose().drop(columns='count'))
+    return summary
+
+# Sidebar clock strings; recomputed at most every 30s rather than on every widget event
+@st.cache_data(ttl=30)
+def _now_strs():
+    now = datetime.now()
+    return now.strftime("%d %b %Y"), now.strftime("%H:%M")
 
 # Sample fallback data
 sample_data = {
@@ -88,9 +121,47 @@ sample_data = {
 }
 
 # ✅ Cached loader that accepts raw bytes
+# usecols must be a tuple so st.cache_data can hash it
+@st.cache_data
+def load_excel_from_bytes(file_bytes, usecols=None):
+    return parse_workbook(file_bytes, usecols)
+
+# 💾 On-disk Parquet sidecars so cold starts skip the XLSX parse entirely
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Memoized on file_hash alone (the leading underscore keeps Streamlit from hashing the bytes),
+# so a rerun with the same upload neither re-reads the sidecar nor re-parses the workbook
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_excel_via_parquet(_file_bytes, file_hash):
+    """Read a workbook from its Parquet sidecar, parsing the XLSX only on a cache miss"""
+    parquet_path = os.path.join(CACHE_DIR, f"{file_hash}.parquet")
+    if os.path.exists(parquet_path):
+        try:
+            return read_parquet_sidecar(parquet_path)
+        except Exception:
+            pass  # Corrupt or unreadable sidecar; re-parse below
+
+    df = normalize_mixed_columns(load_excel_from_bytes(_file_bytes))
+    try:
+        write_parquet_sidecar(df, parquet_path)
+    except Exception as e:
+        # The parsed frame is still usable; the next cold load just parses the XLSX again
+        st.warning(f"Could not write Parquet cache ({parquet_path}): {e}")
+    return df
+
+# Letter-exchange journal for a workbook; re-read only when the sidecar changes
 @st.cache_data
-def load_excel_from_bytes(file_bytes):
-    return pd.read_excel(io.BytesIO(file_bytes))
+def read_exchange_deltas(delta_path, mtime):
+    return pd.read_parquet(delta_path)
+
+def load_exchange_deltas(file_hash):
+    delta_path = exchange_delta_path(file_hash)
+    if os.path.exists(delta_path):
+        try:
+            return read_exchange_deltas(delta_path, os.path.getmtime(delta_path))
+        except Exception:
+            pass  # Unreadable journal; show the workbook as-is
+    return pd.DataFrame(columns=['row_idx', 'ts', 'entry'])
 
 # Import directory selection widget
 from utils.directory_selection_widget import directory_selection_widget
@@ -107,8 +178,19 @@ if uploaded_file:
     st.session_state.file_bytes = file_bytes
     st.session_state.file_name = uploaded_file.name
 
+    # Content hash keys the Parquet sidecar and letter-exchange journal; a name/size key
+    # would confuse same-sized workbooks. file_id is new for every upload, so the bytes are
+    # hashed once per upload rather than on every rerun
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is None or st.session_state.get('file_hash_id') != file_id:
+        st.session_state.file_hash = hashlib.blake2b(file_bytes).hexdigest()[:16]
+        st.session_state.file_hash_id = file_id
+
     # Load and cache the DataFrame
-    df = load_excel_from_bytes(file_bytes)
+    # All columns are kept: other pages edit and re-save this same frame
+    df = load_excel_via_parquet(file_bytes, st.session_state.file_hash)
+    # Re-apply letter-exchange entries recorded since this workbook was loaded
+    df = apply_exchange_deltas(df, load_exchange_deltas(st.session_state.file_hash))
     st.session_state.df = df
 
     st.markdown(f"### 📁 **Loaded File:** `{uploaded_file.name}`")
@@ -125,15 +207,22 @@ else:
 if 'df' not in st.session_state:
     st.session_state.df = pd.DataFrame(sample_data)
 
+# Stage is coerced once at load; only re-cast if another page left it non-numeric
+if not pd.api.types.is_numeric_dtype(st.session_state.df['Stage']):
+    st.session_state.df['Stage'] = pd.to_numeric(st.session_state.df['Stage'], errors='coerce')
+
+# Record counts and sponsor aggregates, memoized on the data
+df_stats = compute_active_summary(st.session_state.df)
 
 
 # SIDEBAR DISPLAY
 # Display current database info in Sidebar
 
 
-st.sidebar.metric("Total Records", len(st.session_state.df))
-st.sidebar.metric("Today's date", datetime.now().strftime("%d %b %Y"))
-st.sidebar.metric("Time", datetime.now().strftime("%H:%M"))
+st.sidebar.metric("Total Records", df_stats['n'])
+today_str, time_str = _now_strs()
+st.sidebar.metric("Today's date", today_str)
+st.sidebar.metric("Time", time_str)
 
 
 # DATA SUMMARY BEGINS
@@ -150,21 +239,14 @@ st.markdown("""
 st.markdown("---")
 
 # ACTIVE SPONSOR COUNT
-# Ensure Stage is numeric
-st.session_state.df['Stage'] = pd.to_numeric(st.session_state.df['Stage'], errors='coerce')
-
-# Filter active sponsees
-active_df = st.session_state.df[st.session_state.df['Stage'] == 12]
-
-# Count unique sponsors and total active sponsees
-num_active_sponsors = active_df['Sponsor'].nunique()
-num_active_sponsees = active_df.shape[0]
+num_active_sponsors = df_stats['n_sponsors']
+num_active_sponsees = df_stats['active_n']
 
 # Display summary
 st.markdown(f"### 📊 Active Sponsorship Count")
 st.markdown(f"- 🧑‍🤝‍🧑 **Sponsors with active sponsees:** {num_active_sponsors}")
 st.markdown(f"- 📋 **Total active sponsees (Stage 12):** {num_active_sponsees}")
-st.dataframe(active_df['Sponsor'].value_counts().rename("Active Sponsees"))
+st.dataframe(df_stats['sponsor_counts'])
 
 # Display same summary data in sidebar
 st.sidebar.markdown("---")
@@ -175,27 +257,16 @@ st.sidebar.metric(label="Active Sponsees", value=num_active_sponsees)
 
 # SPONSOR SPECIFIC DATA
 st.markdown("### 🔍 Filter Active Sponsees by Sponsor")
-# Filter by Sponsor and Stage == 12, excluding nulls
-# Ensure Stage is numeric
-st.session_state.df['Stage'] = pd.to_numeric(st.session_state.df['Stage'], errors='coerce')
-
-# Filter sponsors with at least one Stage == 12
-eligible_sponsors = st.session_state.df[
-    st.session_state.df['Stage'] == 12
-]['Sponsor'].dropna().unique()
-
+# Filter by Sponsor within the already-filtered Stage == 12 rows, excluding nulls
 # Dropdown only shows eligible sponsors
 selected_sponsor = st.selectbox(
     "Choose a Sponsor (Stage = 12 only)",
-    eligible_sponsors,
+    df_stats['eligible_sponsors'],
     key="choose_sponsor_stage12_home"
 )
 
 # Final filtered DataFrame
-filtered_df = st.session_state.df[
-    (st.session_state.df['Sponsor'] == selected_sponsor) &
-    (st.session_state.df['Stage'] == 12)
-]
+filtered_df = st.session_state.df.iloc[df_stats['sponsor_rows'].get(selected_sponsor, [])]
 
 record_count = filtered_df.shape[0]
 
@@ -210,13 +281,13 @@ else:
 
 # SUMMARY STATISTICS
 st.markdown("### Summary Statistics")
-st.dataframe(st.session_state.df.describe(include='all').transpose())
+st.dataframe(compute_summary_stats(st.session_state.df))
 
 # PREVIEW ALL DATA
 st.markdown("### Preview Total Data")
 n = st.slider("Rows to preview", 5, 50, 10)
 # Display only selected columns in preview slider
-st.dataframe(filter_display_columns(st.session_state.df.head(n), DISPLAY_COLUMNS))
+st.dataframe(build_preview_table(st.session_state.df).slice(0, n))
 
 
 #Confidential notification
@@ -1,4 +1,4 @@
-import streamlit as st
+import numpy as np
 
 def caesar_code(first: str, last: str, no: str, s: int = 1) -> str:
     """
@@ -14,7 +14,13 @@ def caesar_code(first: str, last: str, no: str, s: int = 1) -> str:
         str: Encoded string
     """
     combined = f"{first}{last}{no}"
-    shifted = ''.join(chr((ord(c) + s) % 256) for c in combined)
+    try:
+        codes = np.frombuffer(combined.encode('latin-1'), dtype=np.uint8)
+    except UnicodeEncodeError:
+        # Characters outside latin-1 need the per-character path
+        return ''.join(chr((ord(c) + s) % 256) for c in combined)
+    # uint8 addition wraps modulo 256 natively
+    shifted = (codes + np.uint8(s % 256)).tobytes().decode('latin-1')
     return shifted
 
 
@@ -22,6 +28,9 @@ def render_code_generator():
     """
     Streamlit UI component to generate and display a Caesar-coded string.
     """
+    # Imported here so caesar_code (used by core.letter_db) does not need Streamlit
+    import streamlit as st
+
     st.markdown('<h2 class="section-header">🔐 Generate Security Code</h2>', unsafe_allow_html=True)
 
     first = st.text_input("First Name")
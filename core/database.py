@@ -1,12 +1,48 @@
   
+import io
+import os
+import tempfile
+import threading
 import pandas as pd
 from datetime import datetime
 import pytz
 
 
-def save_data(df: pd.DataFrame, path: str = None) -> None:
+# Saves to one path are serialized, and a save that was queued before the last one
+# written is dropped, so the newest frame is the one left on disk
+_excel_locks = {}
+_excel_seq = {}
+_excel_written = {}
+_excel_meta_lock = threading.Lock()
+
+
+def _write_excel(df: pd.DataFrame, path: str, seq: int) -> None:
+    """
+    Write to a unique temp file next to path, then atomically swap it into place.
+    """
+    with _excel_locks[path]:
+        if seq < _excel_written.get(path, 0):
+            return  # A newer save already reached the disk
+        ext = os.path.splitext(path)[1]
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix=ext)
+        os.close(fd)
+        try:
+            df.to_excel(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            _excel_written[path] = seq
+        except Exception as e:
+            # Runs off the Streamlit thread; log to the console instead of the UI
+            print(f"Excel save error ({path}): {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def save_data(df: pd.DataFrame, path: str = None) -> threading.Thread:
     """
     Save updated prisoner data to Excel with a timestamped filename.
+
+    The write runs on a background thread on a snapshot of df so the UI is
+    not blocked; join() the returned thread to wait for it.
     """
     if path is None:
         # Get current time in Pacific Time
@@ -19,4 +55,217 @@ def save_data(df: pd.DataFrame, path: str = None) -> None:
         # Create the filename with the timestamp in the parent directory. NEEDS CHANGING
         path = f"../prisoner_{timestamp}.xlsx"
     
-    df.to_excel(path, index=False)
+    with _excel_meta_lock:
+        _excel_locks.setdefault(path, threading.Lock())
+        seq = _excel_seq[path] = _excel_seq.get(path, 0) + 1
+    writer = threading.Thread(target=_write_excel, args=(df.copy(), path, seq), daemon=True)
+    writer.start()
+    return writer
+
+
+def set_cell(df: pd.DataFrame, row_idx, column: str, value) -> None:
+    """
+    Assign a single cell, widening compact dtypes (category, nullable ints)
+    when the new value does not fit them.
+    """
+    if column in df.columns:
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            if not pd.isna(value) and value not in dtype.categories:
+                df[column] = df[column].cat.add_categories([value])
+        elif pd.api.types.is_numeric_dtype(dtype) and isinstance(value, str):
+            # Form inputs arrive as text; keep numeric columns numeric when possible
+            numeric = pd.to_numeric(value.strip() or None, errors='coerce')
+            if not pd.isna(numeric) or not value.strip():
+                value = numeric
+
+    try:
+        df.at[row_idx, column] = value
+    except (TypeError, ValueError):
+        df[column] = df[column].astype(object)
+        df.at[row_idx, column] = value
+
+
+# Workbook parsing (XLSX -> DataFrame) and its on-disk Parquet sidecar
+
+def read_excel_bytes(file_bytes, **kwargs):
+    """Parse XLSX bytes with the Rust-backed calamine engine, falling back to read-only openpyxl"""
+    try:
+        return pd.read_excel(io.BytesIO(file_bytes), engine="calamine", **kwargs)
+    except (ImportError, ValueError):
+        return pd.read_excel(
+            io.BytesIO(file_bytes),
+            engine="openpyxl",
+            engine_kwargs={"read_only": True, "data_only": True},
+            **kwargs
+        )
+
+
+# Workbooks above this size are streamed row-batch by row-batch instead of parsed in one shot
+LARGE_XLSX_BYTES = 50 * 1024 * 1024
+EXCEL_CHUNK_ROWS = 50_000
+
+
+def read_excel_chunked(file_bytes, usecols=None, chunk_rows=EXCEL_CHUNK_ROWS):
+    """Stream the first sheet with openpyxl read-only mode, building one small DataFrame per batch"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+
+        header = [col if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+        keep = [i for i, col in enumerate(header) if usecols is None or col in usecols]
+        if usecols is not None and len(keep) < len(set(usecols)):
+            raise ValueError("Usecols do not match columns")
+        columns = [header[i] for i in keep]
+
+        chunks, batch = [], []
+        for row in rows:
+            if all(value is None for value in row):
+                continue  # Skip blank rows, as read_excel does
+            batch.append([row[i] if i < len(row) else None for i in keep])
+            if len(batch) >= chunk_rows:
+                chunks.append(pd.DataFrame(batch, columns=columns))
+                batch = []
+        if batch or not chunks:
+            chunks.append(pd.DataFrame(batch, columns=columns))
+        return pd.concat(chunks, ignore_index=True, copy=False)
+    finally:
+        workbook.close()
+
+
+def _arrow_strings(series):
+    """Arrow-backed string column, or the default StringDtype when pyarrow is missing"""
+    try:
+        return series.astype('string[pyarrow]')
+    except ImportError:
+        return series.astype('string')
+
+
+def optimize_dtypes(df):
+    """Cast columns once: numeric Stage, categorical Sponsor/state, smallest integer widths"""
+    if 'Stage' in df.columns:
+        stage = pd.to_numeric(df['Stage'], errors='coerce')
+        try:
+            df['Stage'] = stage.astype('Int8')
+        except (TypeError, ValueError):
+            df['Stage'] = stage  # Non-integer or out-of-range stages
+    # Integers only: float32 would silently round long IDs stored as floats
+    for col in df.select_dtypes('integer').columns:
+        if col != 'Stage':
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in ('Sponsor', 'state'):
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    # Arrow-backed strings hash and compare in C++ instead of per Python object. Parquet
+    # reads bring text back as python-backed StringDtype, so those are converted too
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.StringDtype):
+            if dtype.storage == 'python':
+                df[col] = _arrow_strings(df[col])
+        elif dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) == 'string':
+            df[col] = _arrow_strings(df[col])
+    return df
+
+
+def parse_workbook(file_bytes, usecols=None):
+    """Parse XLSX bytes into a frame with optimized dtypes; usecols is dropped if the sheet lacks any"""
+    reader = read_excel_chunked if len(file_bytes) > LARGE_XLSX_BYTES else read_excel_bytes
+    if usecols is not None:
+        try:
+            return optimize_dtypes(reader(file_bytes, usecols=list(usecols)))
+        except ValueError:
+            pass  # Sheet lacks some requested columns; read everything instead
+    return optimize_dtypes(reader(file_bytes))
+
+
+def normalize_mixed_columns(df):
+    """Store object columns that mix types (e.g. CDCRno ints and strings) as text, keeping NA,
+    so Arrow/Parquet can write them and cold and warm loads see the same values"""
+    for col in df.select_dtypes('object').columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True) not in ('string', 'empty'):
+            df[col] = _arrow_strings(df[col])
+    return df
+
+
+def read_parquet_sidecar(path: str) -> pd.DataFrame:
+    """
+    Load a workbook's Parquet sidecar with the same dtypes a fresh parse produces.
+    """
+    return optimize_dtypes(pd.read_parquet(path))
+
+
+def write_parquet_sidecar(df: pd.DataFrame, path: str) -> None:
+    """
+    Write a parsed workbook (see normalize_mixed_columns) to its Parquet sidecar.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(path)
+
+
+EXCHANGE_COLUMN = 'letter exchange (received only)'
+
+# Letter-exchange entries are journaled per workbook (keyed by its content hash) so
+# they survive a restart that re-reads the original XLSX
+DELTA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+_delta_lock = threading.Lock()
+
+
+def exchange_delta_path(file_hash: str) -> str:
+    return os.path.join(DELTA_DIR, f"{file_hash}.exchange.parquet")
+
+
+def _append_delta(path: str, record: dict) -> None:
+    with _delta_lock:
+        tmp_path = f"{path}.tmp"
+        try:
+            frame = pd.DataFrame([record])
+            if os.path.exists(path):
+                frame = pd.concat([pd.read_parquet(path), frame], ignore_index=True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            frame.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Exchange delta save error ({path}): {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def append_exchange_delta(file_hash: str, row_idx, entry: str) -> threading.Thread:
+    """
+    Journal one letter-exchange entry for row_idx to the workbook's Parquet
+    sidecar on a background thread; join() the returned thread to wait for it.
+    """
+    record = {
+        'row_idx': int(row_idx),
+        'ts': datetime.now().isoformat(timespec='seconds'),
+        'entry': entry
+    }
+    writer = threading.Thread(
+        target=_append_delta, args=(exchange_delta_path(file_hash), record), daemon=True
+    )
+    writer.start()
+    return writer
+
+
+def apply_exchange_deltas(df: pd.DataFrame, deltas: pd.DataFrame) -> pd.DataFrame:
+    """
+    Append journaled entries (oldest first) onto df's letter-exchange column in place.
+    """
+    if deltas.empty:
+        return df
+
+    # One combined entry per row, in the order they were journaled
+    entries = deltas.groupby('row_idx', sort=False)['entry'].agg('\n---\n'.join)
+    entries = entries[entries.index.isin(df.index)]
+    for row_idx, entry in entries.items():
+        current = df.at[row_idx, EXCHANGE_COLUMN] if EXCHANGE_COLUMN in df.columns else None
+        if not pd.isna(current) and str(current).strip():
+            entry = f"{current}\n---\n{entry}"
+        set_cell(df, row_idx, EXCHANGE_COLUMN, entry)
+    return df
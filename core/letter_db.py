@@ -1,11 +1,80 @@
 import sqlite3
 import os
-from datetime import datetime
+import re
+import gzip
+import queue
+import atexit
+import pathlib
+import threading
+import pandas as pd
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime, timedelta
 from core.cipher import caesar_code
+from utils import jsonio
 import json
 import hashlib
+import logging
+
+# Used by make_readable_cpid to split the encoded string into letters and digits
+_NON_LETTER_RE = re.compile(r'[^A-Z]')
+_NON_DIGIT_RE = re.compile(r'[^0-9]')
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4096)
+def _fmt_ddmmmyyyy(year, month, day):
+    """21Sep2025-style display string; cached since the UI re-formats the same dates"""
+    return datetime(year, month, day).strftime('%d%b%Y')
 
 class LetterDatabase:
+    # Applied once to the shared write connection
+    CONNECTION_PRAGMAS = (
+        "PRAGMA journal_mode=WAL;",  # Better concurrency across Streamlit pages
+        "PRAGMA synchronous=NORMAL;",
+        "PRAGMA temp_store=MEMORY;",
+        "PRAGMA cache_size=-20000;",
+        "PRAGMA busy_timeout=5000;",
+        "PRAGMA wal_autocheckpoint=1000;",
+        "PRAGMA mmap_size=134217728;",  # 128 MB
+    )
+
+    # The read-only connection only needs the per-connection cache/timeout settings
+    READER_PRAGMAS = (
+        "PRAGMA temp_store=MEMORY;",
+        "PRAGMA cache_size=-20000;",
+        "PRAGMA busy_timeout=5000;",
+        "PRAGMA mmap_size=134217728;",
+    )
+
+    DATE_FIELDS = (
+        'date_picked_up_po', 'date_env_letter_scanned',
+        'date_letter_postmarked', 'date_began_response', 'date_finished_response'
+    )
+
+    # Columns update_letter_field may change (whitelist; field names are interpolated into SQL)
+    UPDATABLE_FIELDS = DATE_FIELDS + (
+        'prisoner_idx', 'prisoner_code', 'step_work', 'envelope_image_path', 'letter_pages_image_path',
+        'ocr_text', 'ocr_confidence', 'return_address', 'processing_status',
+        'processor_notes', 'raw_ocr_json_path'
+    )
+    
+    # One fixed UPDATE string per field so sqlite3's statement cache can reuse the prepared statement
+    UPDATE_FIELD_SQL = {
+        field: f"UPDATE letters SET {field} = ?, updated_at = ? WHERE letter_id = ?"
+        for field in UPDATABLE_FIELDS
+    }
+
+    # PRAGMA user_version; 1 = dates stored as ISO YYYY-MM-DD instead of 21Sep2025
+    SCHEMA_VERSION = 1
+
+    # Caesar shift by 1 within A-Z and 0-9 (Z->A, 9->0), applied in one str.translate
+    CPID_SHIFT_TABLE = str.maketrans(
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789",
+        "BCDEFGHIJKLMNOPQRSTUVWXYZA1234567890"
+    )
+
     def __init__(self, db_path="letters.db"):
         # Resolve to absolute path under project root to ensure all pages use the same DB file
         project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -13,35 +82,133 @@ class LetterDatabase:
             self.db_path = db_path
         else:
             self.db_path = os.path.join(project_root, db_path)
+        # One write and one read-only connection shared by every thread (Streamlit runs each
+        # rerun on a new thread, so per-thread connections were reopened on almost every rerun)
+        self._shared_conn = None
+        self._read_only_conn = None
+        self._read_open_lock = threading.Lock()
+        # Serializes write transactions and autocommit writes on the shared connection
+        # (all sessions share one instance via utils.letter_db_resource.get_letter_db)
+        self._write_lock = threading.RLock()
+        # (change_token(), count) from the last COUNT(*); see count_letters
+        self._count_cache = None
         self.init_database()
+        # Audit rows are written by a background thread so the UI never waits on them
+        self._audit_q = queue.Queue()
+        threading.Thread(target=self._audit_worker, name="audit-writer", daemon=True).start()
+        atexit.register(self.flush_audit_log)
+
+    @staticmethod
+    def _connect(database, pragmas, **kwargs):
+        """Open a connection usable from any thread and apply pragmas to it"""
+        # isolation_level=None: autocommit single statements, explicit BEGIN for batches
+        conn = sqlite3.connect(database, timeout=10.0, check_same_thread=False, isolation_level=None, **kwargs)
+        conn.row_factory = sqlite3.Row
+        for pragma in pragmas:
+            try:
+                conn.execute(pragma)
+            except sqlite3.DatabaseError:
+                pass  # e.g. WAL unsupported on this filesystem
+        return conn
+    
+    def _conn(self):
+        """Return the shared write connection, opening and tuning it on first use
+        
+        Anything that writes must hold _write_lock so it cannot land inside another
+        thread's open transaction. Plain reads go through _read_conn instead, which
+        never sees a transaction that has not committed yet.
+        """
+        conn = self._shared_conn
+        if conn is None:
+            with self._write_lock:
+                conn = self._shared_conn
+                if conn is None:
+                    conn = self._shared_conn = self._connect(self.db_path, self.CONNECTION_PRAGMAS)
+        return conn
+    
+    def _read_conn(self):
+        """Return the shared read-only connection (mode=ro), opening it on first use
+        
+        In WAL mode a separate connection only sees committed data, so readers on any
+        thread never observe a writer's in-flight transaction and need no lock.
+        """
+        conn = self._read_only_conn
+        if conn is None:
+            # Not _write_lock: a reader must not wait for another thread's transaction
+            with self._read_open_lock:
+                conn = self._read_only_conn
+                if conn is None:
+                    uri = f"{pathlib.Path(self.db_path).as_uri()}?mode=ro"
+                    conn = self._read_only_conn = self._connect(uri, self.READER_PRAGMAS, uri=True)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed statements in one transaction on the shared connection"""
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN")
+            try:
+                yield conn.cursor()
+            except Exception:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+            finally:
+                self._count_cache = None
+    
+    def change_token(self):
+        """Cheap change token for the DB files; in WAL mode commits touch the -wal file first"""
+        stamps = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(0)
+        return tuple(stamps)
     
     @staticmethod
     def format_date(date_obj):
-        """Convert date to 21Sep2025 format"""
+        """Convert date to the stored ISO 2025-09-21 format (sortable, BETWEEN-safe)"""
         if isinstance(date_obj, str):
-            # If already a string, try to parse it first
+            # If already a string, try to parse it first (ISO, then legacy 21Sep2025)
             try:
-                date_obj = datetime.strptime(date_obj, '%Y-%m-%d')
-            except:
-                return date_obj  # Return as-is if can't parse
+                date_obj = datetime.fromisoformat(date_obj)
+            except ValueError:
+                try:
+                    date_obj = datetime.strptime(date_obj, '%d%b%Y')
+                except:
+                    return date_obj  # Return as-is if can't parse
         
         if date_obj:
-            return date_obj.strftime('%d%b%Y')
+            return date_obj.strftime('%Y-%m-%d')
         return ''
     
     @staticmethod
     def format_datetime_to_date(datetime_obj):
-        """Convert datetime to date in 21Sep2025 format"""
+        """Convert datetime to date in the stored ISO 2025-09-21 format"""
         if isinstance(datetime_obj, str):
             try:
-                datetime_obj = datetime.strptime(datetime_obj, '%Y-%m-%d %H:%M:%S')
-            except:
+                datetime_obj = datetime.fromisoformat(datetime_obj)
+            except ValueError:
                 return datetime_obj
         
         if datetime_obj:
-            return datetime_obj.strftime('%d%b%Y')
+            return datetime_obj.strftime('%Y-%m-%d')
         return ''
     
+    @staticmethod
+    def display_date(date_str):
+        """Convert a stored ISO date to the 21Sep2025 display format"""
+        if not date_str:
+            return ''
+        try:
+            parsed = datetime.fromisoformat(date_str)
+            return _fmt_ddmmmyyyy(parsed.year, parsed.month, parsed.day)
+        except (TypeError, ValueError):
+            return date_str  # Return as-is if can't parse
+    
     def make_readable_cpid(self, raw_caesar, prisoner_record):
         """Convert raw Caesar cipher to clean CPID format like MUQ162"""
         # Apply Caesar cipher to just the initials and take first 3 chars
@@ -55,42 +222,29 @@ class LetterDatabase:
         # Combine for encoding
         to_encode = f"{first_initial}{last_initial}{cdcr_suffix}"
         
-        # Apply Caesar cipher with shift=1, but keep only letters/numbers
-        encoded_chars = []
-        for char in to_encode:
-            if char.isalpha():
-                # Shift letters within A-Z range
-                shifted = chr(((ord(char.upper()) - ord('A') + 1) % 26) + ord('A'))
-                encoded_chars.append(shifted)
-            elif char.isdigit():
-                # Shift digits within 0-9 range
-                shifted = str((int(char) + 1) % 10)
-                encoded_chars.append(shifted)
-            else:
-                encoded_chars.append(char)
-        
-        # Take first 3 letters and 3 digits to make MUQ162 format
-        letters = ''.join([c for c in encoded_chars if c.isalpha()])[:3]
-        numbers = ''.join([c for c in encoded_chars if c.isdigit()])[:3]
+        # Apply Caesar cipher with shift=1 to letters/numbers; other characters pass through
+        encoded = to_encode.upper().translate(self.CPID_SHIFT_TABLE)
         
-        # Pad if needed
-        while len(letters) < 3:
-            letters += 'X'
-        while len(numbers) < 3:
-            numbers += '0'
+        # Take first 3 letters and 3 digits to make MUQ162 format, padding if needed
+        letters = _NON_LETTER_RE.sub('', encoded)[:3].ljust(3, 'X')
+        numbers = _NON_DIGIT_RE.sub('', encoded)[:3].ljust(3, '0')
         
         cpid = f"{letters}{numbers}"
         return cpid
     
+    def legacy_prisoner_code(self, prisoner_record):
+        """CPID generated from the record's names and CDCR number, for rows without one"""
+        raw_caesar = caesar_code(
+            prisoner_record['fName'],
+            prisoner_record['lName'], 
+            str(prisoner_record['CDCRno'])
+        )
+        return self.make_readable_cpid(raw_caesar, prisoner_record)
+    
     def init_database(self):
         """Create letters table with standardized date format"""
-        conn = sqlite3.connect(self.db_path, timeout=10.0)
-        cursor = conn.cursor()
-        # Enable WAL for better concurrency across Streamlit pages
-        try:
-            cursor.execute("PRAGMA journal_mode=WAL;")
-        except Exception:
-            pass
+        # WAL, synchronous=NORMAL, busy_timeout etc. are applied when the connection is opened
+        cursor = self._conn().cursor()
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS letters (
@@ -105,7 +259,7 @@ class LetterDatabase:
                 envelope_image_path TEXT,  -- manually redacted, encrypted later, local drive
                 letter_pages_image_path TEXT,  -- PDF, manually redacted, encrypted later, posted online
                 
-                -- Standardized date tracking (21Sep2025 format)
+                -- Standardized date tracking (ISO 2025-09-21 format, displayed as 21Sep2025)
                 date_picked_up_po TEXT,  -- manually entered
                 date_env_letter_scanned TEXT,  -- auto-filled when scanned
                 date_letter_postmarked TEXT,  -- OCR or manual entry/confirmation
@@ -141,8 +295,47 @@ class LetterDatabase:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # Indexes for per-prisoner lookups, date ordering and status reports
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_letters_prisoner_idx ON letters(prisoner_idx)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_letters_scan_date ON letters(date_env_letter_scanned DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_letters_status ON letters(processing_status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_letter ON audit_log(letter_id, timestamp)")
+        
+        self._migrate_schema(cursor)
+        
+        # Keep the hot DB file small: move old audit rows out once the table gets large
+        cursor.execute("SELECT COUNT(*) FROM audit_log")
+        if cursor.fetchone()[0] > self.AUDIT_ROTATE_THRESHOLD:
+            self.rotate_audit_log()
+        
+        # Give the query planner statistics: full ANALYZE the first time, then the cheap optimize
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            cursor.execute("ANALYZE")
+        else:
+            cursor.execute("PRAGMA optimize")
+        
+        # Column whitelist for get_letters_page projections
+        cursor.execute("PRAGMA table_info(letters)")
+        self._letter_columns = {row[1] for row in cursor.fetchall()}
+    
+    def _migrate_schema(self, cursor):
+        """One-time upgrades gated on PRAGMA user_version"""
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+        
+        if version < 1:
+            # Rewrite legacy 21Sep2025 dates as ISO so ORDER BY / BETWEEN sort correctly
+            with self._transaction() as tx:
+                tx.execute(f"SELECT letter_id, {', '.join(self.DATE_FIELDS)} FROM letters")
+                updates = []
+                for letter_id, *dates in tx.fetchall():
+                    updates.append(tuple(self.format_date(d) if d else d for d in dates) + (letter_id,))
+                set_clause = ', '.join(f"{field} = ?" for field in self.DATE_FIELDS)
+                tx.executemany(f"UPDATE letters SET {set_clause} WHERE letter_id = ?", updates)
+                tx.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
     
     def add_letter(self, prisoner_idx, prisoner_record, ocr_data, envelope_image_path, prisoner_code=None):
         """Add new letter record with initial scan data
@@ -151,158 +344,307 @@ class LetterDatabase:
             - If provided, this value is stored as-is (authoritative CPID from the DataFrame)
             - If not provided, fallback to legacy generation to maintain backward compatibility
         """
-        # Determine prisoner_code: prefer provided CPID from DataFrame
-        if prisoner_code:
-            prisoner_code_local = prisoner_code
-        else:
-            # Fallback to legacy generation to avoid breaking older calls
-            raw_caesar = caesar_code(
-                prisoner_record['fName'],
-                prisoner_record['lName'], 
-                str(prisoner_record['CDCRno'])
-            )
-            prisoner_code_local = self.make_readable_cpid(raw_caesar, prisoner_record)
+        return self.add_letters_bulk([
+            (prisoner_idx, prisoner_record, ocr_data, envelope_image_path, prisoner_code)
+        ])[0]
+    
+    def add_letters_bulk(self, items):
+        """Add several scanned letters in one transaction
         
+        items: iterable of (prisoner_idx, prisoner_record, ocr_data, envelope_image_path, prisoner_code)
+        tuples, with the same meaning as the add_letter arguments.
+        
+        Returns:
+            list: New letter IDs, in the same order as items
+        """
         # Format scan date
         scan_date = self.format_datetime_to_date(datetime.now())
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO letters (
-                prisoner_idx, prisoner_code, envelope_image_path,
-                date_env_letter_scanned, ocr_text, return_address, processing_status
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            prisoner_idx,
-            prisoner_code_local,
-            envelope_image_path,
-            scan_date,  # 21Sep2025 format
-            ocr_data.get('full_text', ''),
-            ocr_data.get('return_address', ''),
-            'scanned'
-        ))
-        
-        letter_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        # Log the action
-        self.log_action('letter_added', letter_id, 'envelope_scanned', '', f'Letter envelope scanned on {scan_date}')
-        
-        return letter_id
+        letter_rows = []
+        for prisoner_idx, prisoner_record, ocr_data, envelope_image_path, prisoner_code in items:
+            # Determine prisoner_code: prefer provided CPID from DataFrame
+            if prisoner_code:
+                prisoner_code_local = prisoner_code
+            else:
+                # Fallback to legacy generation to avoid breaking older calls
+                prisoner_code_local = self.legacy_prisoner_code(prisoner_record)
+            
+            letter_rows.append((
+                prisoner_idx,
+                prisoner_code_local,
+                envelope_image_path,
+                scan_date,  # 2025-09-21 format
+                ocr_data.get('full_text', ''),
+                ocr_data.get('return_address', ''),
+                'scanned'
+            ))
+        
+        letter_ids = []
+        with self._transaction() as cursor:
+            for row in letter_rows:
+                cursor.execute('''
+                    INSERT INTO letters (
+                        prisoner_idx, prisoner_code, envelope_image_path,
+                        date_env_letter_scanned, ocr_text, return_address, processing_status
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', row)
+                letter_ids.append(cursor.lastrowid)
+            
+            # Log the actions in the same transaction
+            cursor.executemany(self.AUDIT_INSERT_SQL, [
+                self._audit_row('letter_added', letter_id, 'envelope_scanned', '', f'Letter envelope scanned on {scan_date}')
+                for letter_id in letter_ids
+            ])
+        
+        # Raw Vision responses go to gzip'd files, not into the row (written after commit)
+        json_paths = []
+        for letter_id, (_, _, ocr_data, _, _) in zip(letter_ids, items):
+            raw_response = ocr_data.get('raw_response')
+            if raw_response:
+                path = self._save_raw_ocr(letter_id, raw_response)
+                if path:
+                    json_paths.append((path, letter_id))
+        if json_paths:
+            with self._transaction() as cursor:
+                cursor.executemany("UPDATE letters SET raw_ocr_json_path = ? WHERE letter_id = ?", json_paths)
+        
+        return letter_ids
+    
+    OCR_JSON_DIR = "ocr_json"
+    
+    def _save_raw_ocr(self, letter_id, raw_response):
+        """Write a letter's raw OCR response to ocr_json/<letter_id>.json.gz; returns the path or None"""
+        try:
+            json_dir = os.path.join(os.path.dirname(self.db_path), self.OCR_JSON_DIR)
+            os.makedirs(json_dir, exist_ok=True)
+            path = os.path.join(json_dir, f"{letter_id}.json.gz")
+            with open(path, 'wb') as f:
+                f.write(gzip.compress(jsonio.dumps(raw_response)))
+            return path
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Could not save raw OCR for letter %s: %s", letter_id, e)
+            return None
+    
+    def get_raw_ocr(self, letter_id):
+        """Load a letter's raw OCR response from its gzip'd JSON file (None if not stored)"""
+        cursor = self._read_conn().cursor()
+        cursor.execute("SELECT raw_ocr_json_path FROM letters WHERE letter_id = ?", (letter_id,))
+        row = cursor.fetchone()
+        if not row or not row[0] or not os.path.exists(row[0]):
+            return None
+        with open(row[0], 'rb') as f:
+            data = f.read()
+        return jsonio.loads(gzip.decompress(data) if row[0].endswith('.gz') else data)
     
     def update_letter_field(self, letter_id, field_name, new_value, old_value=None):
         """Update a specific field in letter record with date formatting"""
         
-        # Format dates if it's a date field
-        date_fields = [
-            'date_picked_up_po', 'date_env_letter_scanned', 
-    
-            'date_letter_postmarked', 'date_began_response', 'date_finished_response'
-        ]
+        sql = self.UPDATE_FIELD_SQL.get(field_name)
+        if sql is None:
+            raise ValueError(f"Field cannot be updated: {field_name}")
         
-        if field_name in date_fields and new_value:
+        # Format dates if it's a date field
+        if field_name in self.DATE_FIELDS and new_value:
             new_value = self.format_date(new_value)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Update the field
-        cursor.execute(f'''
-            UPDATE letters 
-            SET {field_name} = ?, updated_at = ?
-            WHERE letter_id = ?
-        ''', (new_value, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), letter_id))
-        
-        conn.commit()
-        conn.close()
+        with self._write_lock:
+            self._conn().execute(sql, (new_value, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), letter_id))
         
         # Log the change
         self.log_action('field_updated', letter_id, field_name, old_value, new_value)
     
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _update_fields_sql(fields):
+        """UPDATE statement for a sorted tuple of whitelisted columns (one string per column set)"""
+        set_clause = ', '.join(f"{field} = ?" for field in fields)
+        return f"UPDATE letters SET {set_clause}, updated_at = ? WHERE letter_id = ?"
+    
+    def update_letter_fields(self, letter_id, changes, old_values=None):
+        """Update several fields of one letter with a single UPDATE in one transaction
+        
+        Args:
+            letter_id: The letter to update
+            changes: Mapping of field name -> new value (dates are formatted as in update_letter_field)
+            old_values: Optional mapping of field name -> previous value, for the audit log
+        
+        Returns:
+            int: Number of fields written
+        """
+        if not changes:
+            return 0
+        unknown = [field for field in changes if field not in self.UPDATE_FIELD_SQL]
+        if unknown:
+            raise ValueError(f"Field cannot be updated: {', '.join(unknown)}")
+        
+        old_values = old_values or {}
+        # Sorted so the same set of columns always maps to the same cached SQL string
+        fields = tuple(sorted(changes))
+        values = [
+            self.format_date(changes[field]) if field in self.DATE_FIELDS and changes[field] else changes[field]
+            for field in fields
+        ]
+        now_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        with self._transaction() as cursor:
+            cursor.execute(self._update_fields_sql(fields), (*values, now_ts, letter_id))
+            cursor.executemany(self.AUDIT_INSERT_SQL, [
+                self._audit_row('field_updated', letter_id, field, old_values.get(field, ''), value)
+                for field, value in zip(fields, values)
+            ])
+        return len(fields)
+    
+    def reassign_letter(self, letter_id, prisoner_idx, prisoner_record, prisoner_code=None, old_prisoner_idx=None):
+        """Point an existing letter at another prisoner
+        
+        prisoner_code falls back to legacy generation from prisoner_record, as in add_letter,
+        since letters.prisoner_code is NOT NULL.
+        """
+        return self.update_letter_fields(
+            letter_id,
+            {
+                'prisoner_idx': prisoner_idx,
+                'prisoner_code': prisoner_code or self.legacy_prisoner_code(prisoner_record),
+            },
+            old_values={'prisoner_idx': old_prisoner_idx} if old_prisoner_idx is not None else None
+        )
+    
     def get_letter_by_id(self, letter_id):
         """Get complete letter record"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM letters WHERE letter_id = ?', (letter_id,))
-            letter = cursor.fetchone()
-            
-            if letter:
-                # Convert to dictionary for easier access
-                columns = [desc[0] for desc in cursor.description]
-                return dict(zip(columns, letter))
-            
-            return None
-        finally:
-            if conn:
-                conn.close()
+        cursor = self._read_conn().cursor()
+        
+        cursor.execute('SELECT * FROM letters WHERE letter_id = ?', (letter_id,))
+        letter = cursor.fetchone()
+        
+        if letter:
+            # Convert to dictionary for easier access (.get in the UI)
+            return dict(letter)
+        
+        return None
     
     def get_letters_for_prisoner(self, prisoner_idx):
         """Get all letters for a specific prisoner"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._read_conn().cursor()
         
         cursor.execute('''
             SELECT * FROM letters WHERE prisoner_idx = ? 
             ORDER BY date_env_letter_scanned DESC
         ''', (prisoner_idx,))
         
-        letters = cursor.fetchall()
-        conn.close()
-        return letters
+        return cursor.fetchall()
     
-    def get_all_letters(self):
-        """Get all letters for management interface"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def iter_all_letters(self):
+        """Stream all letters as sqlite3.Row objects without materializing the table"""
+        cursor = self._read_conn().cursor()
         
         cursor.execute('''
             SELECT * FROM letters 
             ORDER BY date_env_letter_scanned DESC
         ''')
         
-        letters = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        conn.close()
+        yield from cursor
+    
+    def get_all_letters(self):
+        """Get all letters as a DataFrame (newest scan first), built by pandas straight from the cursor
         
-        # Convert to list of dictionaries
-        return [dict(zip(columns, letter)) for letter in letters]
+        Use iter_all_letters to stream rows instead, or count_letters when only the total is needed.
+        """
+        return pd.read_sql_query(
+            "SELECT * FROM letters ORDER BY date_env_letter_scanned DESC", self._read_conn()
+        )
+    
+    LIST_COLUMNS = ('letter_id', 'prisoner_code', 'date_env_letter_scanned', 'processing_status')
+    
+    # Derived columns allowed in get_letters_page, computed in SQL so full OCR text never leaves the DB
+    COMPUTED_COLUMNS = {
+        # Slice first so the newline replaces only scan 120 chars per row
+        'ocr_preview': "replace(replace(substr(ifnull(ocr_text, ''), 1, 120), char(13), ' '), char(10), ' ')",
+    }
+    
+    def count_letters(self):
+        """Total number of letters (for pagination)
+        
+        COUNT(*) walks the whole table, so the result is reused until this instance
+        writes or the DB files change on disk (another process).
+        """
+        token = self.change_token()
+        cached = self._count_cache
+        if cached is not None and cached[0] == token:
+            return cached[1]
+        cursor = self._read_conn().cursor()
+        cursor.execute("SELECT COUNT(*) FROM letters")
+        count = cursor.fetchone()[0]
+        self._count_cache = (token, count)
+        return count
     
+    def get_letters_page(self, offset=0, limit=50, columns=LIST_COLUMNS):
+        """Get one page of letters for list views, newest scan first (then newest id)
+        
+        Only the requested columns are read; heavy fields (ocr_text, raw OCR JSON)
+        should be fetched per letter with get_letter_by_id.
+        """
+        select = []
+        for col in columns:
+            if col in self.COMPUTED_COLUMNS:
+                select.append(f"{self.COMPUTED_COLUMNS[col]} AS {col}")
+            elif col in self._letter_columns:
+                select.append(col)
+            else:
+                raise ValueError(f"Unknown letters column: {col}")
+        
+        cursor = self._read_conn().cursor()
+        cursor.execute(f'''
+            SELECT {', '.join(select)} FROM letters
+            ORDER BY date_env_letter_scanned DESC, letter_id DESC
+            LIMIT ? OFFSET ?
+        ''', (int(limit), int(offset)))
+        return cursor.fetchall()
+    
+    @staticmethod
+    def resolve_prisoner_codes(df):
+        """Authoritative prisoner code (as text) per df row label, vectorized over the frame.
+        
+        Prefers the CPID column and falls back to the legacy 'code' column where CPID
+        is missing or blank; rows with neither are left out.
+        """
+        if 'CPID' in df.columns:
+            codes = df['CPID'].astype(object)
+        else:
+            codes = pd.Series(None, index=df.index, dtype=object)
+        if 'code' in df.columns:
+            text = codes.astype(str)
+            missing = codes.isna() | text.str.lower().eq('nan') | text.str.strip().eq('')
+            codes = codes.mask(missing, df['code'])
+        codes = codes[codes.notna() & ~codes.index.duplicated()].astype(str)
+        return codes[codes.str.lower() != 'nan']
+
     def sync_prisoner_codes_from_df(self, df):
         """Sync letters.prisoner_code from authoritative CPID in the provided DataFrame, using prisoner_idx."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT letter_id, prisoner_idx, prisoner_code FROM letters")
-        rows = cursor.fetchall()
-        updated = 0
         now_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        for letter_id, prisoner_idx, old_code in rows:
-            try:
-                if prisoner_idx in df.index:
-                    cpid_val = None
-                    # Prefer CPID column; fallback to legacy 'code'
-                    if 'CPID' in df.columns:
-                        cpid_val = df.at[prisoner_idx, 'CPID']
-                    if (cpid_val is None or str(cpid_val).lower() == 'nan' or str(cpid_val).strip() == '') and 'code' in df.columns:
-                        cpid_val = df.at[prisoner_idx, 'code']
-                    if cpid_val is not None and str(cpid_val).lower() != 'nan':
-                        cpid_val = str(cpid_val)
-                        if cpid_val != old_code:
-                            cursor.execute(
-                                "UPDATE letters SET prisoner_code = ?, updated_at = ? WHERE letter_id = ?",
-                                (cpid_val, now_ts, letter_id)
-                            )
-                            updated += 1
-            except Exception:
-                # Skip any problematic rows; continue syncing others
-                continue
-        conn.commit()
-        conn.close()
+        codes = self.resolve_prisoner_codes(df)
+        
+        # prisoner_idx is an integer row label; any other index cannot match a letter
+        if not pd.api.types.is_integer_dtype(codes.index.dtype):
+            return 0
+        
+        # Stage the codes in a temp table and let SQLite apply every change in one UPDATE
+        with self._transaction() as cursor:
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS tmp_cpid (prisoner_idx INTEGER PRIMARY KEY, cpid TEXT NOT NULL)")
+            cursor.execute("DELETE FROM tmp_cpid")
+            cursor.executemany(
+                "INSERT OR IGNORE INTO tmp_cpid (prisoner_idx, cpid) VALUES (?, ?)",
+                zip(codes.index.tolist(), codes.tolist())
+            )
+            cursor.execute('''
+                UPDATE letters
+                SET prisoner_code = (SELECT cpid FROM tmp_cpid t WHERE t.prisoner_idx = letters.prisoner_idx),
+                    updated_at = ?
+                WHERE prisoner_idx IN (SELECT prisoner_idx FROM tmp_cpid)
+                  AND prisoner_code IS NOT (SELECT cpid FROM tmp_cpid t WHERE t.prisoner_idx = letters.prisoner_idx)
+            ''', (now_ts,))
+            updated = cursor.rowcount
+            cursor.execute("DROP TABLE tmp_cpid")
         return updated
 
     def delete_letter(self, letter_id: int, delete_files: bool = False) -> bool:
@@ -315,35 +657,18 @@ class LetterDatabase:
         Returns:
             bool: True if deletion completed (row removed), False otherwise
         """
-        # First fetch any file paths before deleting the row
+        # Fetch file paths, delete the row and record the audit entry in one transaction
         envelope_path, pages_path = None, None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+        with self._transaction() as cursor:
             cursor.execute("SELECT envelope_image_path, letter_pages_image_path FROM letters WHERE letter_id = ?", (letter_id,))
             row = cursor.fetchone()
             if row:
                 envelope_path, pages_path = row[0], row[1]
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
-
-        # Delete the letter row
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM letters WHERE letter_id = ?", (letter_id,))
-        conn.commit()
-        conn.close()
-
-        # Audit log (best effort)
-        try:
-            self.log_action('letter_deleted', letter_id, '', '', 'deleted')
-        except Exception:
-            pass
+            
+            cursor.execute("DELETE FROM letters WHERE letter_id = ?", (letter_id,))
+            cursor.execute(self.AUDIT_INSERT_SQL, self._audit_row('letter_deleted', letter_id, '', '', 'deleted'))
 
-        # Optionally delete files from disk
+        # Optionally delete files from disk (after commit so the write lock is not held)
         if delete_files:
             for p in (envelope_path, pages_path):
                 if p and isinstance(p, str) and os.path.exists(p):
@@ -357,8 +682,7 @@ class LetterDatabase:
 
     def get_letters_by_date_range(self, start_date, end_date, date_field='date_env_letter_scanned'):
         """Get letters within date range for reporting"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._read_conn().cursor()
         
         # Convert dates to our format for comparison
         start_formatted = self.format_date(start_date)
@@ -370,14 +694,11 @@ class LetterDatabase:
             ORDER BY {date_field}
         ''', (start_formatted, end_formatted))
         
-        letters = cursor.fetchall()
-        conn.close()
-        return letters
+        return cursor.fetchall()
     
     def get_processing_report(self):
         """Generate processing status report"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._read_conn().cursor()
         
         cursor.execute('''
             SELECT 
@@ -391,19 +712,17 @@ class LetterDatabase:
             ORDER BY processing_status
         ''')
         
-        report = cursor.fetchall()
-        conn.close()
-        return report
+        return cursor.fetchall()
     
-    def log_action(self, action, letter_id=None, field_changed="", old_value="", new_value=""):
-        """Enhanced audit log entry"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO audit_log (timestamp, action, letter_id, field_changed, old_value, new_value, details)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    AUDIT_INSERT_SQL = '''
+        INSERT INTO audit_log (timestamp, action, letter_id, field_changed, old_value, new_value, details)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    @staticmethod
+    def _audit_row(action, letter_id=None, field_changed="", old_value="", new_value=""):
+        """Build the audit_log parameter tuple for AUDIT_INSERT_SQL"""
+        return (
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             action,
             letter_id,
@@ -411,7 +730,81 @@ class LetterDatabase:
             str(old_value),
             str(new_value),
             f"Updated {field_changed}" if field_changed else action
-        ))
+        )
+    
+    AUDIT_BATCH_SIZE = 100
+    AUDIT_ROTATE_THRESHOLD = 50000
+    AUDIT_KEEP_DAYS = 90
+    
+    def rotate_audit_log(self, keep_days=None):
+        """Move audit rows older than keep_days into yearly archive DBs (audit_YYYY.db)
         
-        conn.commit()
-        conn.close()
+        Returns:
+            int: Number of rows moved out of the main database
+        """
+        keep_days = self.AUDIT_KEEP_DAYS if keep_days is None else keep_days
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime('%Y-%m-%d %H:%M:%S')
+        # ATTACH is connection-wide, so hold the lock until the archive is detached again
+        with self._write_lock:
+            conn = self._conn()
+            years = [row[0] for row in conn.execute(
+                "SELECT DISTINCT substr(timestamp, 1, 4) FROM audit_log WHERE timestamp < ?", (cutoff,)
+            )]
+            
+            moved = 0
+            for year in years:
+                archive_path = os.path.join(os.path.dirname(self.db_path), f"audit_{year}.db")
+                # ATTACH/DETACH are not allowed inside a transaction
+                conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+                try:
+                    with self._transaction() as cursor:
+                        cursor.execute('''
+                            CREATE TABLE IF NOT EXISTS archive.audit_log (
+                                log_id INTEGER PRIMARY KEY,
+                                timestamp TEXT NOT NULL,
+                                action TEXT NOT NULL,
+                                letter_id INTEGER,
+                                field_changed TEXT,
+                                old_value TEXT,
+                                new_value TEXT,
+                                details TEXT,
+                                created_at TEXT
+                            )
+                        ''')
+                        where = "timestamp < ? AND substr(timestamp, 1, 4) = ?"
+                        cursor.execute(
+                            f"INSERT OR IGNORE INTO archive.audit_log SELECT * FROM main.audit_log WHERE {where}",
+                            (cutoff, year)
+                        )
+                        cursor.execute(f"DELETE FROM main.audit_log WHERE {where}", (cutoff, year))
+                        moved += cursor.rowcount
+                finally:
+                    conn.execute("DETACH DATABASE archive")
+            return moved
+    
+    
+    def _audit_worker(self):
+        """Drain the audit queue, writing up to AUDIT_BATCH_SIZE rows per transaction"""
+        while True:
+            batch = [self._audit_q.get()]
+            try:
+                while len(batch) < self.AUDIT_BATCH_SIZE:
+                    batch.append(self._audit_q.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                with self._transaction() as cursor:
+                    cursor.executemany(self.AUDIT_INSERT_SQL, batch)
+            except sqlite3.Error:
+                logger.exception("Audit log write failed (%d rows)", len(batch))
+            finally:
+                for _ in batch:
+                    self._audit_q.task_done()
+    
+    def flush_audit_log(self):
+        """Block until every queued audit row has been written"""
+        self._audit_q.join()
+    
+    def log_action(self, action, letter_id=None, field_changed="", old_value="", new_value=""):
+        """Enhanced audit log entry (queued; written by the background audit thread)"""
+        self._audit_q.put(self._audit_row(action, letter_id, field_changed, old_value, new_value))
@@ -1,8 +1,148 @@
 
 import re
+import os
 import json
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions as api_exceptions
+from google.api_core import retry as api_retry
 from google.cloud import vision
+from google.protobuf.json_format import MessageToDict
 from typing import Dict, List, Any
+from utils import jsonio
+
+# Vision results are cached on disk by SHA-256 of the image bytes, so re-running
+# the page on the same upload does not hit the API again. Anchored to the project
+# root so every page (and any working directory) shares one cache
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+OCR_CACHE_DIR = os.path.join(project_root, "ocr_cache")
+
+# US zip codes (12345 or 12345-6789)
+_ZIP_RE = re.compile(r'\b\d{5}(?:-\d{4})?\b')
+
+# Requests per second allowed against Vision across all Streamlit sessions (each
+# rerun is its own thread; default quota is 1800/min per project, staying well
+# under it avoids 429s when several people OCR at once)
+VISION_MAX_RPS = 10
+
+# Back off 1s, 2s, 4s, 8s on throttling / transient unavailability so a short
+# burst of 429/503s doesn't surface as an OCR error on the page
+VISION_RETRY = api_retry.Retry(
+    predicate=api_retry.if_exception_type(
+        api_exceptions.ResourceExhausted,
+        api_exceptions.ServiceUnavailable,
+    ),
+    initial=1.0,
+    maximum=8.0,
+    multiplier=2.0,
+    timeout=30.0,
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class _RateLimiter:
+    """Thread-safe limiter that spaces calls at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_vision_limiter = _RateLimiter(VISION_MAX_RPS)
+
+
+def get_vision_client() -> vision.ImageAnnotatorClient:
+    """Return a shared ImageAnnotatorClient so the gRPC channel is created once."""
+    global _client
+    if _client is None:
+        with _client_lock:  # concurrent sessions call this from their own script threads
+            if _client is None:
+                _client = vision.ImageAnnotatorClient()
+    return _client
+
+
+def _cache_path(digest: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, f"{digest}.json")
+
+
+@lru_cache(maxsize=128)
+def _load_cached_result(digest: str) -> Dict[str, Any]:
+    """Load a cached OCR result; raises FileNotFoundError (not memoized) on a miss."""
+    with open(_cache_path(digest), 'rb') as f:
+        return jsonio.loads(f.read())
+
+
+def _save_cached_result(digest: str, result: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+        tmp_path = _cache_path(digest) + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(jsonio.dumps(result))
+        os.replace(tmp_path, _cache_path(digest))
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Could not cache OCR result: {e}")
+
+
+def _error_result(error_msg: str) -> Dict[str, Any]:
+    return {
+        'full_text': error_msg,
+        'return_address': error_msg,
+        'raw_response': {'error': error_msg}
+    }
+
+
+def _result_from_response(response) -> Dict[str, Any]:
+    """Build the full_text / return_address / raw_response dict from one AnnotateImageResponse."""
+    texts = response.text_annotations
+
+    if texts:
+        full_text = texts[0].description
+
+        # Try to extract return address (typically at the top of envelope)
+        lines = full_text.splitlines()
+
+        # The return address ends at the first zip code within the first 5 lines
+        zip_line = next((i for i, line in enumerate(lines[:5]) if _ZIP_RE.search(line)), None)
+        if zip_line is not None:
+            return_address_lines = lines[:zip_line + 1]
+        else:
+            # Otherwise the first 3 lines are likely the return address
+            return_address_lines = [line.strip() for line in lines[:3] if line.strip()]
+
+        return_address = '\n'.join(return_address_lines) if return_address_lines else "Return address not detected"
+
+        # Convert response to dictionary for JSON serialization; the protobuf
+        # walk happens in C and keeps the snake_case field names
+        raw_response = MessageToDict(
+            vision.AnnotateImageResponse.pb(response),
+            preserving_proto_field_name=True
+        )
+
+        return {
+            'full_text': full_text,
+            'return_address': return_address,
+            'raw_response': raw_response
+        }
+    return {
+        'full_text': "No text found",
+        'return_address': "No text found",
+        'raw_response': {'text_annotations': [], 'full_text_annotation': None}
+    }
+
 
 def extract_text_from_image(image_file) -> Dict[str, Any]:
     """
@@ -15,122 +155,79 @@ def extract_text_from_image(image_file) -> Dict[str, Any]:
         dict: Dictionary containing 'full_text', 'return_address', and 'raw_response'
     """
     try:
-        client = vision.ImageAnnotatorClient()
         content = image_file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        try:
+            return _load_cached_result(digest)
+        except (OSError, ValueError):
+            pass
+
+        client = get_vision_client()
         image = vision.Image(content=content)
-        response = client.text_detection(image=image)
-        texts = response.text_annotations
-
-        if texts:
-            full_text = texts[0].description
-
-            # Try to extract return address (typically at the top of envelope)
-            lines = full_text.split('\n')
-            return_address_lines = []
-
-            # Look for common return address patterns (first few lines, postal codes, etc.)
-            for i, line in enumerate(lines[:5]):  # Check first 5 lines
-                line = line.strip()
-                if not line:
-                    continue
-
-                # Look for postal code patterns (US zip codes)
-                if re.search(r'\b\d{5}(-\d{4})?\b', line):
-                    # Include this line and previous lines as return address
-                    return_address_lines = lines[:i+1]
-                    break
-                elif i < 3:  # First 3 lines are likely return address
-                    return_address_lines.append(line)
-
-            return_address = '\n'.join(return_address_lines) if return_address_lines else "Return address not detected"
-
-            # Convert response to dictionary for JSON serialization
-            raw_response = {
-                'text_annotations': [
-                    {
-                        'description': text.description,
-                        'bounding_poly': {
-                            'vertices': [
-                                {'x': vertex.x, 'y': vertex.y}
-                                for vertex in text.bounding_poly.vertices
-                            ]
-                        } if text.bounding_poly else None,
-                        'locale': text.locale if hasattr(text, 'locale') else None
-                    }
-                    for text in texts
-                ],
-                'full_text_annotation': {
-                    'text': response.full_text_annotation.text if response.full_text_annotation else None,
-                    'pages': [
-                        {
-                            'width': page.width,
-                            'height': page.height,
-                            'blocks': [
-                                {
-                                    'bounding_box': {
-                                        'vertices': [
-                                            {'x': v.x, 'y': v.y}
-                                            for v in block.bounding_box.vertices
-                                        ]
-                                    } if block.bounding_box else None,
-                                    'paragraphs': [
-                                        {
-                                            'bounding_box': {
-                                                'vertices': [
-                                                    {'x': v.x, 'y': v.y}
-                                                    for v in para.bounding_box.vertices
-                                                ]
-                                            } if para.bounding_box else None,
-                                            'words': [
-                                                {
-                                                    'bounding_box': {
-                                                        'vertices': [
-                                                            {'x': v.x, 'y': v.y}
-                                                            for v in word.bounding_box.vertices
-                                                        ]
-                                                    } if word.bounding_box else None,
-                                                    'symbols': [
-                                                        {
-                                                            'text': symbol.text,
-                                                            'bounding_box': {
-                                                                'vertices': [
-                                                                    {'x': v.x, 'y': v.y}
-                                                                    for v in symbol.bounding_box.vertices
-                                                                ]
-                                                            } if symbol.bounding_box else None
-                                                        }
-                                                        for symbol in word.symbols
-                                                    ]
-                                                }
-                                                for word in para.words
-                                            ]
-                                        }
-                                        for para in block.paragraphs
-                                    ]
-                                }
-                                for block in page.blocks
-                            ]
-                        }
-                        for page in response.full_text_annotation.pages
-                    ] if response.full_text_annotation else []
-                } if response.full_text_annotation else None
-            }
-
-            return {
-                'full_text': full_text,
-                'return_address': return_address,
-                'raw_response': raw_response
-            }
-        else:
-            return {
-                'full_text': "No text found",
-                'return_address': "No text found",
-                'raw_response': {'text_annotations': [], 'full_text_annotation': None}
-            }
+        # Every Vision call goes through the shared limiter and retry policy
+        _vision_limiter.acquire()
+        response = client.text_detection(image=image, retry=VISION_RETRY)
+
+        result = _result_from_response(response)
+        _save_cached_result(digest, result)
+        return result
     except Exception as e:
-        error_msg = f"OCR Error: {str(e)}"
-        return {
-            'full_text': error_msg,
-            'return_address': error_msg,
-            'raw_response': {'error': error_msg}
-        }
+        return _error_result(f"OCR Error: {str(e)}")
+
+
+# Vision accepts at most 16 images per BatchAnnotateImages request
+VISION_BATCH_SIZE = 16
+
+
+def extract_text_from_images(image_files: List[Any], max_workers: int = 4) -> List[Dict[str, Any]]:
+    """
+    OCR several uploaded images with BatchAnnotateImages (one round-trip per 16 images).
+
+    Cached images are served from the OCR cache; when there are more than 16 misses
+    the batches are sent concurrently, at most max_workers in flight. Every request
+    goes through the shared rate limiter and retry policy.
+
+    Args:
+        image_files: Uploaded image files (BytesIO or similar)
+        max_workers: Maximum number of batch requests in flight
+
+    Returns:
+        list: One extract_text_from_image-style result dict per file, in input order
+    """
+    contents = [image_file.read() for image_file in image_files]
+    digests = [hashlib.sha256(content).hexdigest() for content in contents]
+    results: List[Dict[str, Any]] = [None] * len(contents)
+
+    pending = []
+    for i, digest in enumerate(digests):
+        try:
+            results[i] = _load_cached_result(digest)
+        except (OSError, ValueError):
+            pending.append(i)
+
+    def annotate_batch(batch: List[int]) -> None:
+        try:
+            feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+            requests = [
+                vision.AnnotateImageRequest(image=vision.Image(content=contents[i]), features=[feature])
+                for i in batch
+            ]
+            _vision_limiter.acquire()
+            response = get_vision_client().batch_annotate_images(requests=requests, retry=VISION_RETRY)
+            for i, image_response in zip(batch, response.responses):
+                if image_response.error.message:
+                    results[i] = _error_result(f"OCR Error: {image_response.error.message}")
+                else:
+                    results[i] = _result_from_response(image_response)
+                    _save_cached_result(digests[i], results[i])
+        except Exception as e:
+            for i in batch:
+                results[i] = _error_result(f"OCR Error: {str(e)}")
+
+    batches = [pending[k:k + VISION_BATCH_SIZE] for k in range(0, len(pending), VISION_BATCH_SIZE)]
+    if len(batches) == 1:
+        annotate_batch(batches[0])
+    elif batches:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            list(executor.map(annotate_batch, batches))
+    return results
@@ -2,91 +2,141 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 import os
-from datetime import datetime
+from datetime import date, datetime
 from core.letter_db import LetterDatabase
+from utils.letter_db_resource import get_letter_db
+
+LETTERS_PAGE_SIZE = 50
+
+# Summary table columns; ocr_preview is computed in SQL from ocr_text
+LETTER_LIST_COLUMNS = (
+    'letter_id',
+    'prisoner_code',              # CPID
+    'date_env_letter_scanned',    # 21Sep2025 format
+    'processing_status',
+    'ocr_preview',                # quick glance at Vision OCR text
+    'return_address'              # sender extracted by OCR (if available)
+)
+
+LETTER_LIST_COLUMN_CONFIG = {
+    'letter_id': st.column_config.NumberColumn("ID", width="small"),
+    'prisoner_code': st.column_config.TextColumn("CPID", width="small"),
+    'date_env_letter_scanned': st.column_config.TextColumn("Scanned", width="small"),
+    'processing_status': st.column_config.TextColumn("Status", width="small"),
+    'ocr_preview': st.column_config.TextColumn("OCR preview", width="large"),
+    'return_address': st.column_config.TextColumn("Return address", width="medium"),
+}
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _count_letters(_letter_db, db_path, token):
+    return _letter_db.count_letters()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_letters(_letter_db, db_path, token, offset, limit):
+    """One page of the summary table plus its selectbox labels ({letter_id: label});
+    reruns reuse both until the DB token changes"""
+    rows = _letter_db.get_letters_page(offset=offset, limit=limit, columns=LETTER_LIST_COLUMNS)
+    letters_df = pd.DataFrame([tuple(row) for row in rows], columns=list(LETTER_LIST_COLUMNS))
+    
+    # Dates are stored as ISO; show them in 21Sep2025 format
+    letters_df['date_env_letter_scanned'] = letters_df['date_env_letter_scanned'].map(LetterDatabase.display_date)
+    
+    labels = (
+        'Letter #' + letters_df['letter_id'].astype(str)
+        + ' - ' + letters_df['prisoner_code'].fillna('').astype(str)
+        + ' (' + letters_df['date_env_letter_scanned'].fillna('').astype(str) + ')'
+    )
+    letter_labels = dict(zip(letters_df['letter_id'].tolist(), labels.tolist()))
+    return letters_df, letter_labels
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_letter(_letter_db, db_path, token, letter_id):
+    return _letter_db.get_letter_by_id(letter_id)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _read_file_bytes(path, mtime, size):
+    """File contents for previews/downloads; (mtime, size) in the key picks up changes on disk"""
+    with open(path, "rb") as f:
+        return f.read()
+
+def _preview_bytes(path):
+    """One os.stat for existence + cache key, then the cached read; raises FileNotFoundError"""
+    stat = os.stat(path)
+    return _read_file_bytes(path, stat.st_mtime_ns, stat.st_size)
+
+def _invalidate_letters():
+    """Drop cached letter reads after a write from this page"""
+    _count_letters.clear()
+    _load_letters.clear()
+    _load_letter.clear()
 
 def render_letter_management():
     st.markdown('<h2 class="section-header">📋 Letter Management</h2>', unsafe_allow_html=True)
     
-    # Initialize database - ensure we use the same instance as OCR processing
-    if 'letter_db' not in st.session_state:
-        try:
-            st.session_state.letter_db = LetterDatabase()
-            st.info("📋 Letter database initialized")
-        except Exception as e:
-            st.error(f"❌ Could not initialize letter database: {e}")
-            return
+    # Shared database handle - the same instance OCR processing uses
+    try:
+        st.session_state.letter_db = get_letter_db()
+    except Exception as e:
+        st.error(f"❌ Could not initialize letter database: {e}")
+        return
     
     # Debug info
     st.sidebar.write(f"Database path: {st.session_state.letter_db.db_path}")
     
-    # Get all letters
+    # Get one page of letters (list columns only; full records are loaded on selection)
     try:
-        letters = st.session_state.letter_db.get_all_letters()
-        st.sidebar.write(f"Found {len(letters)} letters in database")
+        db_path = st.session_state.letter_db.db_path
+        token = st.session_state.letter_db.change_token()
+        total_letters = _count_letters(st.session_state.letter_db, db_path, token)
+        st.sidebar.write(f"Found {total_letters} letters in database")
+        n_pages = max(1, -(-total_letters // LETTERS_PAGE_SIZE))
+        page = st.sidebar.number_input("Letters page", min_value=1, max_value=n_pages, value=1, step=1)
+        letters_df, letter_labels = _load_letters(
+            st.session_state.letter_db, db_path, token,
+            (page - 1) * LETTERS_PAGE_SIZE, LETTERS_PAGE_SIZE
+        )
         
         # Optional: Sync prisoner_code (CPID) from authoritative DataFrame
         if 'df' in st.session_state and isinstance(st.session_state.df, pd.DataFrame) and not st.session_state.df.empty:
             if st.sidebar.button("🔄 Sync CPIDs from DataFrame"):
                 try:
                     updated = st.session_state.letter_db.sync_prisoner_codes_from_df(st.session_state.df)
+                    _invalidate_letters()
                     st.sidebar.success(f"Synchronized {updated} CPID value(s)")
                     st.rerun()
                 except Exception as sync_err:
                     st.sidebar.error(f"CPID sync failed: {sync_err}")
     except Exception as e:
         st.error(f"❌ Could not retrieve letters: {e}")
-        letters = []
+        letters_df = pd.DataFrame(columns=list(LETTER_LIST_COLUMNS))
+        letter_labels = {}
+        total_letters = 0
     
-    if letters:
-        st.subheader(f"📊 Total Letters: {len(letters)}")
+    if not letters_df.empty:
+        st.subheader(f"📊 Total Letters: {total_letters}")
         
-        # Create DataFrame for display
-        letters_df = pd.DataFrame(letters)
-        
-        # Add an OCR preview column for quick visibility (first 120 chars, single line)
-        if 'ocr_text' in letters_df.columns:
-            letters_df['ocr_preview'] = (
-                letters_df['ocr_text']
-                .fillna('')
-                .astype(str)
-                .str.replace('\r', ' ', regex=False)
-                .str.replace('\n', ' ', regex=False)
-                .str.slice(0, 120)
-            )
-        else:
-            letters_df['ocr_preview'] = ''
-        
-        # Display summary table with OCR preview and return address
-        display_columns = [
-            'letter_id',
-            'prisoner_code',              # CPID
-            'date_env_letter_scanned',    # 21Sep2025 format
-            'processing_status',
-            'ocr_preview',                 # NEW: quick glance at Vision OCR text
-            'return_address'               # NEW: sender extracted by OCR (if available)
-        ]
-        available_columns = [col for col in display_columns if col in letters_df.columns]
-        
-        st.dataframe(letters_df[available_columns], use_container_width=True)
+        # Display summary table with OCR preview (first 120 chars, single line) and return address
+        st.dataframe(
+            letters_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config=LETTER_LIST_COLUMN_CONFIG
+        )
         
         # Letter selection and details
         st.markdown("---")
         st.subheader("📝 Letter Details")
         
-        # Letter selection
-        letter_options = [f"Letter #{letter['letter_id']} - {letter['prisoner_code']} ({letter['date_env_letter_scanned']})" 
-                         for letter in letters]
-        
-        selected_option = st.selectbox(
+        # Letter selection: options are letter IDs, labels looked up by ID
+        letter_id = st.selectbox(
             "Select letter to view/edit:",
-            options=["None"] + letter_options
+            options=[None] + list(letter_labels),
+            format_func=lambda i: "None" if i is None else letter_labels[i]
         )
         
-        if selected_option != "None":
-            # Extract letter ID from selection
-            letter_id = int(selected_option.split("#")[1].split(" ")[0])
-            letter_record = st.session_state.letter_db.get_letter_by_id(letter_id)
+        if letter_id is not None:
+            # The list only carries summary columns; the full record is one cached PK lookup
+            letter_record = _load_letter(st.session_state.letter_db, db_path, token, letter_id)
             
             if letter_record:
                 render_letter_details_form(letter_record)
@@ -100,20 +150,36 @@ def render_letter_management():
         st.markdown("4. Click **Update Letter Exchange** to save to database")
         st.markdown("5. Return here to manage letter details")
 
+# Editable fields in the details form; each widget is keyed "<letter_id>:<field>"
+FORM_FIELDS = (
+    'envelope_image_path',
+    'letter_pages_image_path',
+    'date_picked_up_po',
+    'date_letter_postmarked',
+    'date_began_response',
+    'date_finished_response',
+    'processing_status',
+    'processor_notes'
+)
+
+def _as_text(value):
+    """Normalize a form/DB value for change detection (None == '', dates as ISO)"""
+    return '' if value is None else str(value)
+
+def parse_date_format(date_str):
+    """Parse stored ISO 2025-09-21 format to date object (date.fromisoformat, no strptime)"""
+    if not date_str:
+        return None
+    try:
+        return date.fromisoformat(date_str)
+    except (TypeError, ValueError):
+        return None
+
 def render_letter_details_form(letter_record):
     """Comprehensive letter details editing form with proper date handling"""
     
-    st.subheader(f"📝 Letter #{letter_record['letter_id']} Details")
-    
-    # Helper function to parse our date format
-    def parse_date_format(date_str):
-        """Parse 21Sep2025 format to date object"""
-        if not date_str:
-            return None
-        try:
-            return datetime.strptime(date_str, '%d%b%Y').date()
-        except:
-            return None
+    letter_id = letter_record['letter_id']
+    st.subheader(f"📝 Letter #{letter_id} Details")
     
     # Use form to prevent constant reloads
     with st.form(key=f"letter_form_{letter_record['letter_id']}"):
@@ -125,7 +191,7 @@ def render_letter_details_form(letter_record):
             st.text_input("Letter ID:", value=letter_record['letter_id'], disabled=True)
             st.text_input("Prisoner Code:", value=letter_record['prisoner_code'], disabled=True)
         with col2:
-            st.text_input("Date Scanned:", value=letter_record.get('date_env_letter_scanned', ''), disabled=True)
+            st.text_input("Date Scanned:", value=LetterDatabase.display_date(letter_record.get('date_env_letter_scanned', '')), disabled=True)
             st.text_input("Return Address:", value=letter_record.get('return_address', ''), disabled=True)
         
         
@@ -137,6 +203,7 @@ def render_letter_details_form(letter_record):
             envelope_path = st.text_input(
                 "Envelope image path:",
                 value=letter_record.get('envelope_image_path', ''),
+                key=f"{letter_id}:envelope_image_path",
                 help="Local drive, manually redacted, encrypted later"
             )
         
@@ -144,6 +211,7 @@ def render_letter_details_form(letter_record):
             letter_pages_path = st.text_input(
                 "Letter pages image path (PDF):",
                 value=letter_record.get('letter_pages_image_path', ''),
+                key=f"{letter_id}:letter_pages_image_path",
                 help="Manually redacted, encrypted later, posted online"
             )
         
@@ -155,26 +223,29 @@ def render_letter_details_form(letter_record):
             date_picked_up = st.date_input(
                 "Date picked up from PO:",
                 value=parse_date_format(letter_record.get('date_picked_up_po', '')),
-                help="Manual entry - will be saved as 21Sep2025 format"
+                key=f"{letter_id}:date_picked_up_po",
+                help="Manual entry - saved as ISO 2025-09-21"
             )
             
             date_postmarked = st.date_input(
                 "Date letter postmarked:",
                 value=parse_date_format(letter_record.get('date_letter_postmarked', '')),
-                help="OCR or manual entry/confirmation - will be saved as 21Sep2025 format"
+                key=f"{letter_id}:date_letter_postmarked",
+                help="OCR or manual entry/confirmation - saved as ISO 2025-09-21"
             )
             
             date_began_response = st.date_input(
                 "Date began writing response:",
                 value=parse_date_format(letter_record.get('date_began_response', '')),
-                help="Manual entry/confirmation - will be saved as 21Sep2025 format"
+                key=f"{letter_id}:date_began_response",
+                help="Manual entry/confirmation - saved as ISO 2025-09-21"
             )
         
         with col2:
             # Show scan date (read-only, already in correct format)
             st.text_input(
                 "Date envelope/letter scanned:",
-                value=letter_record.get('date_env_letter_scanned', ''),
+                value=LetterDatabase.display_date(letter_record.get('date_env_letter_scanned', '')),
                 disabled=True,
                 help="Auto-filled when scanned (21Sep2025 format)"
             )
@@ -182,7 +253,8 @@ def render_letter_details_form(letter_record):
             date_finished_response = st.date_input(
                 "Date finished writing response:",
                 value=parse_date_format(letter_record.get('date_finished_response', '')),
-                help="Manual entry - will be saved as 21Sep2025 format"
+                key=f"{letter_id}:date_finished_response",
+                help="Manual entry - saved as ISO 2025-09-21"
             )
         
         # Processing Status
@@ -198,6 +270,7 @@ def render_letter_details_form(letter_record):
             "Processing Status:",
             options=status_options,
             index=status_options.index(current_status) if current_status in status_options else 0,
+            key=f"{letter_id}:processing_status",
             help="Track the current stage of letter processing"
         )
         
@@ -217,21 +290,11 @@ def render_letter_details_form(letter_record):
         processor_notes = st.text_area(
             "Processor Notes:",
             value=letter_record.get('processor_notes', ''),
+            key=f"{letter_id}:processor_notes",
             height=100,
             help="Add any additional notes about this letter"
         )
         
-        # OCR Text Preview
-        if letter_record.get('ocr_text'):
-            st.markdown("### 📄 OCR Text Preview")
-            with st.expander("View OCR Text (Click to expand)"):
-                st.text_area(
-                    "Full OCR Text:",
-                    value=letter_record['ocr_text'],
-                    height=200,
-                    disabled=True
-                )
-        
         # Form submission
         st.markdown("---")
         col1, col2 = st.columns(2)
@@ -241,35 +304,28 @@ def render_letter_details_form(letter_record):
             cancel_clicked = st.form_submit_button("❌ Cancel", type="secondary", use_container_width=True)
         
         if save_clicked:
-            # Update all fields with proper date formatting
-            updates = {
-                'step_work': step_work,
-                'envelope_image_path': envelope_path,
-                'letter_pages_image_path': letter_pages_path,
-                'date_picked_up_po': date_picked_up,  # Will be formatted in update_letter_field
-                'date_letter_postmarked': date_postmarked,
-                'date_began_response': date_began_response,
-                'date_finished_response': date_finished_response,
-                'processing_status': processing_status,
-                'processor_notes': processor_notes
-            }
+            # Compare the whole form against the record first; diff per field only if something changed
+            form_values = {field: st.session_state[f"{letter_id}:{field}"] for field in FORM_FIELDS}
+            new_signature = tuple(_as_text(value) for value in form_values.values())
+            old_signature = tuple(_as_text(letter_record.get(field)) for field in FORM_FIELDS)
             
-            # Update each field that changed
             changes_made = 0
-            for field, new_value in updates.items():
-                old_value = letter_record.get(field, '')
-                if str(new_value) != str(old_value):
-                    st.session_state.letter_db.update_letter_field(
-                        letter_record['letter_id'], 
-                        field, 
-                        new_value, 
-                        old_value
-                    )
-                    changes_made += 1
+            if new_signature != old_signature:
+                # Write every field that changed in one UPDATE (dates are formatted by the DB layer)
+                changed = {
+                    field: value for field, value, old in zip(FORM_FIELDS, form_values.values(), old_signature)
+                    if _as_text(value) != old
+                }
+                changes_made = st.session_state.letter_db.update_letter_fields(
+                    letter_id,
+                    changed,
+                    {field: letter_record.get(field, '') for field in changed}
+                )
             
             if changes_made > 0:
+                _invalidate_letters()
                 st.success(f"✅ Letter details updated successfully! ({changes_made} fields changed)")
-                st.info("📅 All dates saved in 21Sep2025 format for easy reporting")
+                st.info("📅 All dates saved in ISO 2025-09-21 format for easy sorting and reporting")
                 st.balloons()
             else:
                 st.info("ℹ️ No changes detected")
@@ -280,6 +336,18 @@ def render_letter_details_form(letter_record):
             st.info("❌ Changes cancelled")
             st.rerun()
 
+    # OCR Text Preview (outside the form so the checkbox takes effect immediately)
+    if letter_record.get('ocr_text'):
+        st.markdown("### 📄 OCR Text Preview")
+        # Only send the (possibly multi-KB) text to the browser when asked for
+        if st.checkbox("Show full OCR text", key=f"show_ocr_{letter_id}"):
+            st.text_area(
+                "Full OCR Text:",
+                value=letter_record['ocr_text'],
+                height=200,
+                disabled=True
+            )
+
     # Previews (outside the form to allow download buttons)
     st.markdown("### 📷 Previews")
     preview_env_path = letter_record.get('envelope_image_path', '')
@@ -287,42 +355,45 @@ def render_letter_details_form(letter_record):
     colp1, colp2 = st.columns(2)
     with colp1:
         if preview_env_path:
-            if os.path.exists(preview_env_path):
+            try:
+                env_bytes = _preview_bytes(preview_env_path)
+            except FileNotFoundError:
+                st.info("Envelope image not found on disk")
+            except Exception as e:
+                st.warning(f"Cannot read envelope image: {e}")
+            else:
                 try:
-                    st.image(preview_env_path, caption="Envelope image", width=380)
+                    st.image(env_bytes, caption="Envelope image", width=380)
                 except Exception as e:
                     st.warning(f"Cannot display envelope image: {e}")
                 try:
-                    with open(preview_env_path, "rb") as f:
-                        st.download_button(
-                            label="📥 Download envelope image",
-                            data=f,
-                            file_name=os.path.basename(preview_env_path),
-                            key=f"dl_env_{letter_record['letter_id']}"
-                        )
+                    st.download_button(
+                        label="📥 Download envelope image",
+                        data=env_bytes,
+                        file_name=os.path.basename(preview_env_path),
+                        key=f"dl_env_{letter_record['letter_id']}"
+                    )
                 except Exception as e:
                     st.warning(f"Cannot offer envelope download: {e}")
-            else:
-                st.info("Envelope image not found on disk")
     with colp2:
         if preview_pdf_path:
-            if os.path.exists(preview_pdf_path):
-                try:
-                    st.markdown(f"📄 Letter PDF: {os.path.basename(preview_pdf_path)}")
-                except Exception:
-                    pass
+            try:
+                pdf_bytes = _preview_bytes(preview_pdf_path)
+            except FileNotFoundError:
+                st.info("Letter PDF not found on disk")
+            except Exception as e:
+                st.warning(f"Cannot offer PDF download: {e}")
+            else:
+                st.markdown(f"📄 Letter PDF: {os.path.basename(preview_pdf_path)}")
                 try:
-                    with open(preview_pdf_path, "rb") as f:
-                        st.download_button(
-                            label="📥 Download letter PDF",
-                            data=f,
-                            file_name=os.path.basename(preview_pdf_path),
-                            key=f"dl_pdf_{letter_record['letter_id']}"
-                        )
+                    st.download_button(
+                        label="📥 Download letter PDF",
+                        data=pdf_bytes,
+                        file_name=os.path.basename(preview_pdf_path),
+                        key=f"dl_pdf_{letter_record['letter_id']}"
+                    )
                 except Exception as e:
                     st.warning(f"Cannot offer PDF download: {e}")
-            else:
-                st.info("Letter PDF not found on disk")
 
     # Danger Zone: Delete Letter
     st.markdown("---")
@@ -340,6 +411,7 @@ def render_letter_details_form(letter_record):
                 try:
                     ok = st.session_state.letter_db.delete_letter(letter_record['letter_id'], delete_files=delete_files)
                     if ok:
+                        _invalidate_letters()
                         st.success(f"Letter #{letter_record['letter_id']} deleted.")
                         st.balloons()
                         st.rerun()
@@ -355,8 +427,7 @@ def render_reporting_section():
     st.markdown("---")
     st.subheader("📊 Reports")
     
-    if 'letter_db' not in st.session_state:
-        st.session_state.letter_db = LetterDatabase()
+    st.session_state.letter_db = get_letter_db()
     
     # Processing status report
     if st.button("📈 Generate Processing Status Report"):
@@ -365,6 +436,8 @@ def render_reporting_section():
         if report:
             st.markdown("### Processing Status Summary")
             report_df = pd.DataFrame(report, columns=['Status', 'Count', 'Earliest Scan', 'Latest Scan'])
+            for col in ('Earliest Scan', 'Latest Scan'):
+                report_df[col] = report_df[col].map(LetterDatabase.display_date)
             st.dataframe(report_df, use_container_width=True)
             
             # Simple chart
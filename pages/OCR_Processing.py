@@ -1,11 +1,16 @@
+import io
 import sys
+import importlib.util
 import os
-import re
-import json
+import hashlib
+import tempfile
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
 import streamlit as st
+from PIL import Image, ImageOps
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT_DIR not in sys.path:
@@ -14,59 +19,340 @@ if ROOT_DIR not in sys.path:
 # Explicitly load .env from project root
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 env_path = os.path.join(project_root, '.env')
-load_dotenv(dotenv_path=env_path, override=True)
 
 
+# The page script re-runs on every widget interaction; parse .env once per process
+@st.cache_resource
+def _load_env():
+    load_dotenv(dotenv_path=env_path, override=True)
+    return True
+
+
+_load_env()
+
+
+# core.ocr pulls in google-cloud-vision (gRPC, protobuf); it is imported only when
+# OCR actually runs, so opening the page just checks that the client is installed
 try:
-    from core.ocr import extract_text_from_image
-    OCR_AVAILABLE = True
+    OCR_AVAILABLE = importlib.util.find_spec("google.cloud.vision") is not None
 except ImportError:
     OCR_AVAILABLE = False
 
+from core.database import set_cell, append_exchange_delta
+from utils import jsonio
+from services.name_matching import LastNameMatcher
+
 try:
     from core.letter_db import LetterDatabase
+    from utils.letter_db_resource import get_letter_db
     LETTER_DB_AVAILABLE = True
 except ImportError:
     LETTER_DB_AVAILABLE = False
 
 
+# Vision gains nothing from pixels beyond this on an envelope; smaller uploads are faster
+OCR_MAX_DIM = 1600
+OCR_JPEG_QUALITY = 85
+
+
+# Memoized too, so re-running OCR on the same upload skips the decode and resize
+@st.cache_data(show_spinner=False, max_entries=16)
+def prepare_image_for_ocr(content: bytes) -> bytes:
+    """Downscale to OCR_MAX_DIM on the long edge and re-encode as JPEG before upload."""
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            img = ImageOps.exif_transpose(img)
+            if max(img.size) > OCR_MAX_DIM:
+                img.thumbnail((OCR_MAX_DIM, OCR_MAX_DIM), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.convert('RGB').save(buffer, format='JPEG', quality=OCR_JPEG_QUALITY, optimize=True)
+    except (OSError, ValueError):
+        # Not something Pillow can read; let Vision have the original
+        return content
+    prepared = buffer.getvalue()
+    return prepared if len(prepared) < len(content) else content
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _ocr_image_bytes(content: bytes) -> dict:
+    """OCR one image, memoized on its bytes; failures raise so they are never cached."""
+    from core.ocr import extract_text_from_image
+
+    ocr_result = extract_text_from_image(io.BytesIO(content))
+    error = ocr_result.get('raw_response', {}).get('error')
+    if error:
+        raise RuntimeError(error)
+    return ocr_result
+
+
+BATCH_INPUT = "Upload Multiple Files"
+
+
+def _ocr_batch(uploaded_files, archival_quality):
+    """OCR every upload in one go; returns {file_id: result} (errors are kept per file)."""
+    from core.ocr import extract_text_from_images
+
+    contents = [f.getvalue() for f in uploaded_files]
+    if not archival_quality:
+        contents = [prepare_image_for_ocr(content) for content in contents]
+    results = extract_text_from_images([io.BytesIO(content) for content in contents])
+    return {f.file_id: result for f, result in zip(uploaded_files, results)}
+
+
+def _select_batch_envelope():
+    """
+    Multi-envelope upload: OCR all files at once, then pick the envelope to match and save.
+
+    The chosen envelope's OCR result is loaded into the same session keys the single-file
+    flow fills, so matching and letter saving below work unchanged. Returns its upload.
+    """
+    uploaded_files = st.file_uploader(
+        "Choose image files", type=['png', 'jpg', 'jpeg'], accept_multiple_files=True, key="batch_upload"
+    )
+    if not uploaded_files:
+        return None
+
+    archival_quality = st.checkbox(
+        "Archival quality",
+        key="batch_archival",
+        help="Send the images to OCR at full resolution instead of downscaled JPEGs"
+    )
+    batch_ocr = st.session_state.batch_ocr
+    # Forget results for files removed from the uploader
+    for file_id in set(batch_ocr) - {f.file_id for f in uploaded_files}:
+        del batch_ocr[file_id]
+    pending = [f for f in uploaded_files if f.file_id not in batch_ocr]
+    if pending and st.button(f"Extract Text from {len(pending)} Envelope(s)", type="primary", key="extract_batch"):
+        with st.status(f"Processing {len(pending)} envelope(s) with Google Vision API...") as ocr_status:
+            batch_ocr.update(_ocr_batch(pending, archival_quality))
+            failed = sum(1 for f in pending if batch_ocr[f.file_id].get('raw_response', {}).get('error'))
+            ocr_status.update(
+                label=f"OCR complete ({failed} failed)" if failed else "OCR complete",
+                state="error" if failed else "complete",
+                expanded=bool(failed)
+            )
+
+    done = [i for i, f in enumerate(uploaded_files) if f.file_id in batch_ocr]
+    if not done:
+        return None
+    choice = st.selectbox(
+        "Envelope to process:",
+        done,
+        format_func=lambda i: f"{i + 1}. {uploaded_files[i].name}",
+        key="batch_choice"
+    )
+    chosen = uploaded_files[choice]
+    result = batch_ocr[chosen.file_id]
+    error = result.get('raw_response', {}).get('error')
+    if error:
+        st.error(f"❌ OCR failed for {chosen.name}: {error}")
+        st.session_state.ocr_completed = False
+        st.session_state.batch_loaded_id = None
+        return chosen
+
+    if st.session_state.get('batch_loaded_id') != chosen.file_id:
+        # A new envelope starts with no prisoner selected, so the auto-save can't reuse the last one
+        st.session_state.extracted_text = result['full_text']
+        st.session_state.return_address = result['return_address']
+        st.session_state.raw_ocr_response = result.get('raw_response', {})
+        st.session_state.ocr_completed = True
+        st.session_state.selected_prisoner_idx = None
+        st.session_state.show_actions = False
+        st.session_state.prisoner_select = "None"
+        st.session_state.batch_loaded_id = chosen.file_id
+    return chosen
+
+
+# Cap on matched prisoner rows shown in the table and selectbox
+MAX_SHOWN_MATCHES = 50
+
+
+@st.cache_resource(max_entries=4)
+def _lname_matcher(lnames: pd.Series) -> LastNameMatcher:
+    """Last-name matcher for one dataset (shared across sessions; the column is prepared once)."""
+    return LastNameMatcher(lnames)
+
+
+def find_potential_matches(df, extracted_text):
+    """Return the df index labels whose lName matches a word of the OCR text."""
+    return _lname_matcher(df['lName']).match(extracted_text)
+
+
+
+# Envelope images are written off the script thread so a rerun never waits on the disk;
+# the futures live in st.session_state.image_writes until a later rerun reports them
+_IO_POOL = ThreadPoolExecutor(max_workers=2)
+
+
+def _write_image(path, content):
+    """Write an envelope image, losslessly re-compressing PNGs when that makes them smaller."""
+    data = content
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            if img.format == 'PNG':
+                buffer = io.BytesIO()
+                img.save(buffer, format='PNG', optimize=True)
+                if buffer.tell() < len(content):
+                    data = buffer.getvalue()
+    except (OSError, ValueError):
+        pass  # Not decodable; keep the original bytes
+
+    # Unique temp name so two sessions saving the same image never share a partial file
+    tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False)
+    try:
+        with tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+    except OSError:
+        os.remove(tmp.name)
+        raise
+
+
+def _save_image(image_path, content):
+    """Queue the envelope image write (once per path) and report its state so far."""
+    image_writes = st.session_state.image_writes
+    if image_path not in image_writes and not os.path.exists(image_path):
+        image_writes[image_path] = _IO_POOL.submit(_write_image, image_path, content)
+
+    future = image_writes.get(image_path)
+    if future is not None and not future.done():
+        st.info(f"📸 Saving image to: `{image_path}`")
+        return
+    try:
+        _wait_for_image(image_path)
+    except OSError as e:
+        st.error(f"Could not save image to `{image_path}`: {e}")
+        return
+    st.success(f"📸 Image saved to: `{image_path}`")
+
+
+def _wait_for_image(image_path):
+    """Block until a queued write of image_path has finished; raises OSError if it failed."""
+    future = st.session_state.get('image_writes', {}).pop(image_path, None)
+    if future is not None:
+        future.result()
+
+
+def _image_digest(uploaded_file):
+    """Short content hash of an upload, recomputed only when a different file arrives."""
+    upload_key = (getattr(uploaded_file, "file_id", None), uploaded_file.name, uploaded_file.size)
+    if st.session_state.get('image_digest_key') != upload_key:
+        st.session_state.image_digest = hashlib.blake2b(uploaded_file.getvalue()).hexdigest()[:16]
+        st.session_state.image_digest_key = upload_key
+    return st.session_state.image_digest
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _prisoner_codes(code_columns: pd.DataFrame) -> dict:
+    """Row label -> CPID (falling back to the legacy 'code'), resolved for the whole frame at once."""
+    return LetterDatabase.resolve_prisoner_codes(code_columns).to_dict()
+
+
+def _cpid_for(row_idx):
+    """CPID for a df row, from the same resolution the letters DB sync uses."""
+    df = st.session_state.df
+    code_columns = [col for col in ('CPID', 'code') if col in df.columns]
+    if not code_columns:
+        return None
+    return _prisoner_codes(df[code_columns]).get(row_idx)
+
+
+# Placeholder envelope path when no image was saved; never used to dedupe letters
+NO_IMAGE_PATH = 'uploaded_file'
+
+
+def _save_letter(row_idx, image_path, selected_record=None):
+    """
+    Record the current OCR result as a letter for row_idx, at most once per image.
+
+    Returns (letter_id, status) with status 'created', 'existing' (this image is already
+    saved for this prisoner) or 'reassigned' (the image was saved for another row, e.g.
+    by the auto-save on the first selection, and the letter now points at row_idx).
+    The df row is only materialized when a letter is written and none is passed in.
+    """
+    if image_path != NO_IMAGE_PATH:
+        # The letter must not point at an image whose background write failed
+        _wait_for_image(image_path)
+
+    saved_letters = st.session_state.setdefault('saved_letters', {})
+    if image_path != NO_IMAGE_PATH and image_path in saved_letters:
+        letter_id, saved_idx = saved_letters[image_path]
+        if saved_idx == row_idx:
+            return letter_id, 'existing'
+        if selected_record is None:
+            selected_record = st.session_state.df.iloc[row_idx]
+        st.session_state.letter_db.reassign_letter(
+            letter_id,
+            prisoner_idx=row_idx,
+            prisoner_record=selected_record,
+            prisoner_code=_cpid_for(row_idx),
+            old_prisoner_idx=saved_idx
+        )
+        saved_letters[image_path] = (letter_id, row_idx)
+        return letter_id, 'reassigned'
+
+    if selected_record is None:
+        selected_record = st.session_state.df.iloc[row_idx]
+
+    ocr_data = {
+        'full_text': st.session_state.get('extracted_text', ''),
+        'return_address': st.session_state.get('return_address', ''),
+        'raw_response': st.session_state.get('raw_ocr_response', {})
+    }
+    letter_id = st.session_state.letter_db.add_letter(
+        prisoner_idx=row_idx,
+        prisoner_record=selected_record,
+        ocr_data=ocr_data,
+        envelope_image_path=image_path,
+        prisoner_code=_cpid_for(row_idx)
+    )
+    if image_path != NO_IMAGE_PATH:
+        saved_letters[image_path] = (letter_id, row_idx)
+    return letter_id, 'created'
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _credentials_file_exists(cred_path):
+    return os.path.exists(cred_path)
+
 
 def setup_google_credentials():
     """Setup Google Cloud credentials from environment variables"""
     cred_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-    
-    if cred_path and os.path.exists(cred_path):
-        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = cred_path
-        return True
-    return False
+    # The key file is stat'ed at most once a minute per path rather than on every rerun;
+    # the TTL means a key file added after a failed check is picked up without a restart
+    return bool(cred_path) and _credentials_file_exists(cred_path)
+
+
+# Session keys this page relies on; list/dict are called so each session gets its own
+SESSION_DEFAULTS = {
+    'selected_prisoner_idx': None,
+    'show_actions': False,
+    'ocr_completed': False,
+    'envelope_queue': list,
+    'edit_mode': False,
+    'extracted_text': "",
+    'return_address': "",
+    'saved_letters': dict,
+    'image_writes': dict,
+    'batch_ocr': dict,
+}
+
 
 def render_ocr_processing():
     st.markdown('<h2 class="section-header">OCR Document Processing</h2>', unsafe_allow_html=True)
 
     # Initialize session state at the very beginning
-    if 'selected_prisoner_idx' not in st.session_state:
-        st.session_state.selected_prisoner_idx = None
-    if 'show_actions' not in st.session_state:
-        st.session_state.show_actions = False
-    if 'ocr_completed' not in st.session_state:
-        st.session_state.ocr_completed = False
-    if 'envelope_queue' not in st.session_state:
-        st.session_state.envelope_queue = []
-    if 'edit_mode' not in st.session_state:
-        st.session_state.edit_mode = False
-    if 'extracted_text' not in st.session_state:
-        st.session_state.extracted_text = ""
-    if 'return_address' not in st.session_state:
-        st.session_state.return_address = ""
-    if 'saved_letters' not in st.session_state:
-        st.session_state.saved_letters = {}
+    for key, default in SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = default() if callable(default) else default
     
     # Initialize letter database
     letter_db_working = LETTER_DB_AVAILABLE
-    if 'letter_db' not in st.session_state and LETTER_DB_AVAILABLE:
+    if LETTER_DB_AVAILABLE:
         try:
-            st.session_state.letter_db = LetterDatabase()
-            st.sidebar.success("📋 Letter database connected")
+            # Shared across sessions and pages; the handle is created once per process
+            st.session_state.letter_db = get_letter_db()
         except Exception as e:
             st.sidebar.error(f"❌ Database error: {e}")
             letter_db_working = False
@@ -75,7 +361,7 @@ def render_ocr_processing():
     if letter_db_working and 'letter_db' in st.session_state:
         st.sidebar.write(f"Database: {st.session_state.letter_db.db_path}")
         try:
-            letter_count = len(st.session_state.letter_db.get_all_letters())
+            letter_count = st.session_state.letter_db.count_letters()
             st.sidebar.write(f"Letters in DB: {letter_count}")
         except:
             st.sidebar.write("Letters in DB: Error reading")
@@ -135,76 +421,91 @@ def render_ocr_processing():
     directory_selection_widget()
 
     # Choose input method
-    input_method = st.radio("Choose input method:", ["Upload File", "Take Photo with Webcam"])
+    input_method = st.radio("Choose input method:", ["Upload File", BATCH_INPUT, "Take Photo with Webcam"])
 
     uploaded_file = None
     if input_method == "Upload File":
         uploaded_file = st.file_uploader("Choose an image file", type=['png', 'jpg', 'jpeg'])
+    elif input_method == BATCH_INPUT:
+        uploaded_file = _select_batch_envelope()
     else:
         uploaded_file = st.camera_input("Take a photo of the envelope")
 
     if uploaded_file:
         st.image(uploaded_file, caption="Uploaded Document", width=400)
 
+        # Saved images are named by content, so reruns and re-uploads reuse one file
+        image_digest = _image_digest(uploaded_file)
+
         # Save captured image and raw data to disk
         if input_method == "Take Photo with Webcam":
             # Create images directory if it doesn't exist
             images_dir = os.path.join(project_root, "saved_images")
             os.makedirs(images_dir, exist_ok=True)
 
-            # Save with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_filename = f"webcam_capture_{timestamp}"
+            base_filename = f"webcam_capture_{image_digest}"
             image_filename = f"{base_filename}.png"
             json_filename = f"{base_filename}.json"
             image_path = os.path.join(images_dir, image_filename)
             json_path = os.path.join(images_dir, json_filename)
 
             # Save the image
-            with open(image_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
+            _save_image(image_path, uploaded_file.getvalue())
 
             # Save raw OCR data as JSON (will be saved after OCR processing)
-            st.success(f"📸 Image saved to: `{image_path}`")
             # Persist for DB autosave even after reruns
             st.session_state.last_image_path = image_path
-        elif input_method == "Upload File":
+        else:
             # Also persist uploaded files to disk so Letter Management can reference them
             images_dir = os.path.join(project_root, "saved_images")
             os.makedirs(images_dir, exist_ok=True)
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             orig_name = getattr(uploaded_file, "name", "upload")
             _, ext = os.path.splitext(orig_name)
             if ext.lower() not in [".png", ".jpg", ".jpeg"]:
                 ext = ".png"
-            base_filename = f"upload_{timestamp}"
+            base_filename = f"upload_{image_digest}"
             image_filename = f"{base_filename}{ext.lower()}"
             image_path = os.path.join(images_dir, image_filename)
 
             # Save the uploaded image bytes
-            with open(image_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
+            _save_image(image_path, uploaded_file.getvalue())
 
-            st.success(f"📸 Image saved to: `{image_path}`")
             # Persist for DB autosave even after reruns
             st.session_state.last_image_path = image_path
 
+        if input_method == BATCH_INPUT:
+            run_ocr = False  # Already OCR'd with the rest of the batch
+        else:
+            archival_quality = st.checkbox(
+                "Archival quality",
+                help="Send the image to OCR at full resolution instead of a downscaled JPEG"
+            )
+            run_ocr = st.button("Extract Text with OCR", type="primary", key="extract_ocr")
+
         # OCR Processing Button
-        if st.button("Extract Text with OCR", type="primary", key="extract_ocr"):
-            with st.spinner("Processing with Google Vision API..."):
+        if run_ocr:
+            # Each stage is reported as it finishes instead of behind one opaque spinner
+            with st.status("Processing with Google Vision API...") as ocr_status:
                 try:
-                    ocr_result = extract_text_from_image(uploaded_file)
+                    image_bytes = uploaded_file.getvalue()
+                    if not archival_quality:
+                        original_size = len(image_bytes)
+                        image_bytes = prepare_image_for_ocr(image_bytes)
+                        st.write(f"Image prepared: {original_size // 1024} KB → {len(image_bytes) // 1024} KB")
+                    ocr_result = _ocr_image_bytes(image_bytes)
                     if isinstance(ocr_result, dict):
                         extracted_text = ocr_result['full_text']
                         return_address = ocr_result['return_address']
                         raw_response = ocr_result.get('raw_response', {})
+                        st.write(f"Text extracted ({len(extracted_text)} characters)")
+                        st.text(return_address)
 
                         # Save raw JSON data for webcam captures
                         if input_method == "Take Photo with Webcam" and 'json_path' in locals():
                             try:
-                                with open(json_path, 'w', encoding='utf-8') as f:
-                                    json.dump(raw_response, f, indent=2, ensure_ascii=False)
+                                with open(json_path, 'wb') as f:
+                                    f.write(jsonio.dumps(raw_response, indent=True))
                                 st.success(f"📄 Raw OCR data saved to: `{json_path}`")
                             except Exception as json_error:
                                 st.warning(f"Could not save JSON data: {json_error}")
@@ -217,10 +518,13 @@ def render_ocr_processing():
                     # Store OCR results in session state
                     st.session_state.extracted_text = extracted_text
                     st.session_state.return_address = return_address if 'return_address' in locals() else ""
+                    st.session_state.raw_ocr_response = raw_response
                     st.session_state.ocr_completed = True
+                    ocr_status.update(label="OCR complete", state="complete", expanded=False)
 
                 except Exception as e:
                     error_msg = str(e)
+                    ocr_status.update(label="OCR failed", state="error", expanded=True)
                     st.error("❌ OCR Processing Failed!")
                     st.warning(f"Error: {error_msg}")
 
@@ -244,81 +548,64 @@ def render_ocr_processing():
 
             # Basic matching logic - improved
             st.subheader("Database Matching:")
-            words = extracted_text.split()
-            potential_matches = []
-
-            for word in words:
-                # Skip very short words that might cause too many false matches
-                if len(word) < 3:
-                    continue
-
-                # Escape special regex characters to prevent regex errors
-                escaped_word = re.escape(word)
-
-                try:
-                    matches = st.session_state.df[
-                        st.session_state.df['lName'].str.contains(escaped_word, case=False, na=False)
-                    ]
-                    if not matches.empty:
-                        potential_matches.extend(matches.index.tolist())
-                except re.error:
-                    # Skip words that still cause regex errors
-                    continue
+            # Matching depends only on the OCR text and the loaded data, so the reruns
+            # triggered by the selectbox and action buttons below reuse the last result;
+            # df_version is bumped by in-place record edits (e.g. a corrected lName)
+            match_key = (
+                extracted_text, id(st.session_state.df), len(st.session_state.df),
+                st.session_state.get('df_version', 0)
+            )
+            if st.session_state.get('match_key') != match_key:
+                st.session_state.potential_matches = find_potential_matches(st.session_state.df, extracted_text)
+                st.session_state.match_key = match_key
+            potential_matches = st.session_state.potential_matches
 
             if potential_matches:
-                st.success(f"Found {len(set(potential_matches))} potential matches:")
-                matched_records = st.session_state.df.iloc[list(set(potential_matches))]
-                st.dataframe(matched_records[['fName', 'lName', 'CDCRno', 'housing']])  # Show relevant columns
-
-                # Create better selectbox options
-                select_options = ["None"] + [
-                    f"Row {idx}: {row['fName']} {row['lName']} ({row['CDCRno']})"
-                    for idx, row in matched_records.iterrows()
-                ]
+                # First-seen order, deduped; only the shown rows are copied out of df
+                unique_matches = pd.unique(np.asarray(potential_matches))
+                if len(unique_matches) > MAX_SHOWN_MATCHES:
+                    st.success(f"Found {len(unique_matches)} potential matches (showing the first {MAX_SHOWN_MATCHES}):")
+                else:
+                    st.success(f"Found {len(unique_matches)} potential matches:")
+                matched_records = st.session_state.df.iloc[unique_matches[:MAX_SHOWN_MATCHES]]
+                # Once a prisoner is chosen the table is only sent on request, so the reruns
+                # from the action buttons and edit form below don't re-serialize it
+                if (st.session_state.get("prisoner_select", "None") == "None"
+                        or st.checkbox("Show all matches", key="show_match_table")):
+                    st.dataframe(matched_records[['fName', 'lName', 'CDCRno', 'housing']])  # Show relevant columns
+
+                # Map each option label straight to its row index (no label parsing)
+                options_map = {"None": None}
+                options_map.update(
+                    (f"Row {idx}: {f_name} {l_name} ({cdcr_no})", idx)
+                    for idx, f_name, l_name, cdcr_no in zip(
+                        matched_records.index,
+                        matched_records['fName'],
+                        matched_records['lName'],
+                        matched_records['CDCRno']
+                    )
+                )
 
                 selected_match = st.selectbox(
                     "Select prisoner record:",
-                    select_options,
+                    list(options_map),
                     key="prisoner_select"
                 )
 
-                if selected_match != "None":
-                    # Extract row index more safely
-                    row_idx = int(selected_match.split(":")[0].replace("Row ", ""))
+                row_idx = options_map[selected_match]
+                if row_idx is not None:
                     st.session_state.selected_prisoner_idx = row_idx
                     st.session_state.show_actions = True
 
                     # Auto-save letter to DB once a prisoner is selected (no extra click needed)
                     try:
-                        if LETTER_DB_AVAILABLE and 'letter_db' in st.session_state:
-                            image_path_to_save = st.session_state.get('last_image_path', None)
-                            # Avoid duplicate insert for same image
-                            already_saved = image_path_to_save and image_path_to_save in st.session_state.get('saved_letters', {})
-                            if image_path_to_save and not already_saved:
-                                ocr_data = {
-                                    'full_text': st.session_state.get('extracted_text', ''),
-                                    'return_address': st.session_state.get('return_address', '')
-                                }
-                                selected_record = st.session_state.df.iloc[row_idx]
-                                # Use CPID from DataFrame (authoritative)
-                                cpid_value = None
-                                try:
-                                    if 'CPID' in selected_record.index and pd.notna(selected_record['CPID']):
-                                        cpid_value = str(selected_record['CPID'])
-                                    elif 'code' in selected_record.index and pd.notna(selected_record['code']):
-                                        cpid_value = str(selected_record['code'])
-                                except Exception:
-                                    cpid_value = None
-
-                                letter_id = st.session_state.letter_db.add_letter(
-                                    prisoner_idx=row_idx,
-                                    prisoner_record=selected_record,
-                                    ocr_data=ocr_data,
-                                    envelope_image_path=image_path_to_save,
-                                    prisoner_code=cpid_value
-                                )
+                        image_path_to_save = st.session_state.get('last_image_path', None)
+                        if LETTER_DB_AVAILABLE and 'letter_db' in st.session_state and image_path_to_save:
+                            letter_id, status = _save_letter(row_idx, image_path_to_save)
+                            if status == 'created':
                                 st.info(f"📋 Letter #{letter_id} saved to database")
-                                st.session_state.saved_letters[image_path_to_save] = letter_id
+                            elif status == 'reassigned':
+                                st.info(f"📋 Letter #{letter_id} reassigned to the selected prisoner")
                     except Exception as autosave_err:
                         st.warning(f"Could not auto-save letter to DB: {autosave_err}")
 
@@ -343,55 +630,42 @@ def render_ocr_processing():
                     with col1:
                         if st.button("📝 Update Letter Exchange", type="primary", use_container_width=True, key="update_exchange"):
                             # Handle NaN values in letter exchange
-                            current_exchange = st.session_state.df.iloc[row_idx]['letter exchange (received only)']
+                            current_exchange = st.session_state.df.at[row_idx, 'letter exchange (received only)']
                             if pd.isna(current_exchange) or current_exchange == "":
                                 current_exchange = ""
                             else:
                                 current_exchange = str(current_exchange)
 
-                            new_entry = f"{datetime.now().strftime('%Y-%m-%d %H:%M')}: OCR Document processed - {os.path.basename(image_path) if 'image_path' in locals() else 'Document'}"
+                            new_entry = f"{datetime.now().isoformat(sep=' ', timespec='minutes')}: OCR Document processed - {os.path.basename(image_path) if 'image_path' in locals() else 'Document'}"
                             if current_exchange.strip():
                                 new_exchange = f"{current_exchange}\n---\n{new_entry}"
                             else:
                                 new_exchange = new_entry
 
                             st.session_state.df.at[row_idx, 'letter exchange (received only)'] = new_exchange
+                            # Journal the entry so it survives reloading the original workbook
+                            if st.session_state.get('file_hash'):
+                                append_exchange_delta(st.session_state.file_hash, row_idx, new_entry)
                             
                             # Add to letter database if available
                             if LETTER_DB_AVAILABLE and 'letter_db' in st.session_state:
                                 try:
-                                    ocr_data = {
-                                        'full_text': extracted_text,
-                                        'return_address': st.session_state.get('return_address', '')
-                                    }
-                                    # Use a default image path if webcam wasn't used
-                                    image_path_to_save = image_path if 'image_path' in locals() else 'uploaded_file'
-                                    
-                                    # Use CPID from the selected DataFrame row (authoritative, no recompute)
-                                    cpid_value = None
-                                    try:
-                                        if 'CPID' in selected_record.index and pd.notna(selected_record['CPID']):
-                                            cpid_value = str(selected_record['CPID'])
-                                        elif 'code' in selected_record.index and pd.notna(selected_record['code']):
-                                            cpid_value = str(selected_record['code'])
-                                    except Exception:
-                                        cpid_value = None
-                                    
-                                    letter_id = st.session_state.letter_db.add_letter(
-                                        prisoner_idx=row_idx,
-                                        prisoner_record=selected_record,
-                                        ocr_data=ocr_data,
-                                        envelope_image_path=image_path_to_save,
-                                        prisoner_code=cpid_value
-                                    )
-                                    st.success(f"📋 Letter #{letter_id} added to database successfully!")
-                                    
-                                    # Debug: Show database status
-                                    try:
-                                        letter_count = len(st.session_state.letter_db.get_all_letters())
-                                        st.info(f"📊 Database now contains {letter_count} letters")
-                                    except Exception as count_error:
-                                        st.warning(f"Could not count letters: {count_error}")
+                                    # Use a default image path if no image was saved
+                                    image_path_to_save = image_path if 'image_path' in locals() else NO_IMAGE_PATH
+                                    letter_id, status = _save_letter(row_idx, image_path_to_save, selected_record)
+                                    if status == 'created':
+                                        st.success(f"📋 Letter #{letter_id} added to database successfully!")
+
+                                        # Debug: Show database status
+                                        try:
+                                            letter_count = st.session_state.letter_db.count_letters()
+                                            st.info(f"📊 Database now contains {letter_count} letters")
+                                        except Exception as count_error:
+                                            st.warning(f"Could not count letters: {count_error}")
+                                    elif status == 'reassigned':
+                                        st.info(f"📋 Letter #{letter_id} reassigned to this prisoner")
+                                    else:
+                                        st.info(f"📋 Letter #{letter_id} is already in the database")
                                         
                                 except Exception as db_error:
                                     st.error(f"❌ Could not save to letter database: {db_error}")
@@ -410,34 +684,14 @@ def render_ocr_processing():
                         # Dedicated save to DB button (so a letter is recorded even if not updating the exchange)
                         if st.button("💾 Save Letter to Database", type="secondary", use_container_width=True, key="save_letter_db"):
                             try:
-                                # Prepare data for DB
-                                image_path_to_save = image_path if 'image_path' in locals() else 'uploaded_file'
-                                ocr_data = {
-                                    'full_text': extracted_text,
-                                    'return_address': st.session_state.get('return_address', '')
-                                }
-                                # Use CPID from the selected DataFrame row (authoritative)
-                                cpid_value = None
-                                try:
-                                    if 'CPID' in selected_record.index and pd.notna(selected_record['CPID']):
-                                        cpid_value = str(selected_record['CPID'])
-                                    elif 'code' in selected_record.index and pd.notna(selected_record['code']):
-                                        cpid_value = str(selected_record['code'])
-                                except Exception:
-                                    cpid_value = None
-
-                                # Save to DB
-                                letter_id = st.session_state.letter_db.add_letter(
-                                    prisoner_idx=row_idx,
-                                    prisoner_record=selected_record,
-                                    ocr_data=ocr_data,
-                                    envelope_image_path=image_path_to_save,
-                                    prisoner_code=cpid_value
-                                )
-                                st.success(f"📋 Letter #{letter_id} saved to database")
-                                # Track in session to avoid duplicates
-                                if 'saved_letters' in st.session_state:
-                                    st.session_state.saved_letters[image_path_to_save] = letter_id
+                                image_path_to_save = image_path if 'image_path' in locals() else NO_IMAGE_PATH
+                                letter_id, status = _save_letter(row_idx, image_path_to_save, selected_record)
+                                if status == 'created':
+                                    st.success(f"📋 Letter #{letter_id} saved to database")
+                                elif status == 'reassigned':
+                                    st.success(f"📋 Letter #{letter_id} reassigned to this prisoner")
+                                else:
+                                    st.info(f"📋 Letter #{letter_id} is already in the database")
                             except Exception as e:
                                 st.error(f"❌ Failed to save letter to DB: {e}")
 
@@ -456,47 +710,33 @@ def render_ocr_processing():
 
                             columns = list(selected_record.index)
                             mid_point = len(columns) // 2
+                            # Missing values become "" and everything else text, in one pass over the row
+                            record_str = selected_record.fillna("").astype(str).to_dict()
 
                             with col1:
                                 st.markdown("**Basic Information:**")
-                                for i, col in enumerate(columns[:mid_point]):
-                                    current_value = selected_record[col]
-                                    if pd.isna(current_value):
-                                        current_value = ""
-
-                                    # Handle different data types
-                                    if col in ['CDCRno']:  # Numeric fields
-                                        edited_record[col] = st.text_input(
-                                            f"{col}:",
-                                            value=str(current_value) if current_value != "" else "",
-                                            key=f"form_edit_{col}_{row_idx}"
-                                        )
-                                    else:  # Text fields
-                                        edited_record[col] = st.text_input(
-                                            f"{col}:",
-                                            value=str(current_value) if current_value != "" else "",
-                                            key=f"form_edit_{col}_{row_idx}"
-                                        )
+                                for col in columns[:mid_point]:
+                                    edited_record[col] = st.text_input(
+                                        f"{col}:",
+                                        value=record_str[col],
+                                        key=f"form_edit_{col}_{row_idx}"
+                                    )
 
                             with col2:
                                 st.markdown("**Additional Information:**")
-                                for i, col in enumerate(columns[mid_point:], mid_point):
-                                    current_value = selected_record[col]
-                                    if pd.isna(current_value):
-                                        current_value = ""
-
-                                    # Handle different data types
+                                for col in columns[mid_point:]:
+                                    current_value = record_str[col]
                                     if col in ['CDCRno']:  # Numeric fields
                                         edited_record[col] = st.text_input(
                                             f"{col}:",
-                                            value=str(current_value) if current_value != "" else "",
+                                            value=current_value,
                                             key=f"form_edit_{col}_{row_idx}"
                                         )
                                     else:  # Text fields
                                         edited_record[col] = st.text_area(
                                             f"{col}:",
-                                            value=str(current_value) if current_value != "" else "",
-                                            height=60 if len(str(current_value)) > 50 else 40,
+                                            value=current_value,
+                                            height=60 if len(current_value) > 50 else 40,
                                             key=f"form_edit_{col}_{row_idx}"
                                         )
 
@@ -514,15 +754,16 @@ def render_ocr_processing():
                                         if col in ['CDCRno'] and new_value.strip():
                                             # Try to convert to number for numeric fields
                                             try:
-                                                st.session_state.df.at[row_idx, col] = int(new_value.strip())
+                                                set_cell(st.session_state.df, row_idx, col, int(new_value.strip()))
                                             except ValueError:
-                                                st.session_state.df.at[row_idx, col] = new_value.strip()
+                                                set_cell(st.session_state.df, row_idx, col, new_value.strip())
                                         else:
                                             # Handle empty strings as NaN for consistency
                                             if new_value.strip() == "":
-                                                st.session_state.df.at[row_idx, col] = pd.NA
+                                                set_cell(st.session_state.df, row_idx, col, pd.NA)
                                             else:
-                                                st.session_state.df.at[row_idx, col] = new_value.strip()
+                                                set_cell(st.session_state.df, row_idx, col, new_value.strip())
+                                    st.session_state.df_version = st.session_state.get('df_version', 0) + 1
 
                                     st.success("✅ Prisoner record updated successfully!")
                                     st.balloons()
@@ -545,7 +786,7 @@ def render_ocr_processing():
                                 'cdcr_no': selected_record['CDCRno'],
                                 'housing': selected_record['housing'],
                                 'address': selected_record.get('address', ''),
-                                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M'),
+                                'timestamp': datetime.now().isoformat(sep=' ', timespec='minutes'),
                                 'source': 'OCR Processing'
                             }
                             
@@ -577,11 +818,15 @@ def render_ocr_processing():
                             if st.button("💾 Save Note", type="primary", key="save_note"):
                                 if note_text.strip():
                                     # Add note to letter exchange or create a notes field
-                                    current_notes = st.session_state.df.iloc[row_idx].get('processing_notes', '')
+                                    # Scalar read; no need to copy the whole row
+                                    current_notes = (
+                                        st.session_state.df.at[row_idx, 'processing_notes']
+                                        if 'processing_notes' in st.session_state.df.columns else ''
+                                    )
                                     if pd.isna(current_notes):
                                         current_notes = ""
 
-                                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M')
+                                    timestamp = datetime.now().isoformat(sep=' ', timespec='minutes')
                                     new_note = f"{timestamp}: {note_text.strip()}"
                                     if current_notes.strip():
                                         updated_notes = f"{current_notes}\n---\n{new_note}"
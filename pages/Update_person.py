@@ -7,7 +7,7 @@ if ROOT_DIR not in sys.path:
     
 import streamlit as st
 import pandas as pd
-from core.database import save_data
+from core.database import save_data, set_cell
 from utils.search_widget import render_search_widget
 
 def render_update_person():
@@ -104,7 +104,9 @@ def render_update_person():
                         df = st.session_state.df
                         # Update all selected columns
                         for column, value in updated_values.items():
-                            df.at[row_idx, column] = value
+                            set_cell(df, row_idx, column, value)
+                        # Cached OCR matches are keyed on this; edits happen in place
+                        st.session_state.df_version = st.session_state.get('df_version', 0) + 1
 
                         save_data(df)
                         st.success("✅ Person updated successfully!")
@@ -1,13 +1,25 @@
-# requirements: streamlit, python-docx, PyPDF2, reportlab
+# requirements: streamlit, python-docx, pypdfium2 (or PyPDF2), reportlab
 import streamlit as st
 from docx import Document
+from docx.oxml.ns import qn
 from io import BytesIO
 import os
-import PyPDF2
+import threading
+try:
+    import pypdfium2 as pdfium  # PDFium (C++) text extraction, much faster than PyPDF2
+    PDFIUM_AVAILABLE = True
+    # PDFium itself is not thread-safe: every call into it, not just document loading, must
+    # be serialized, so PDFs extract one at a time even when several are uploaded
+    _PDFIUM_LOCK = threading.Lock()
+except ImportError:
+    import PyPDF2
+    PDFIUM_AVAILABLE = False
 import json
 import base64
+import hashlib
 import time
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -17,20 +29,48 @@ from reportlab.lib.units import inch
 from utils.search_widget import render_search_widget
 
 
-def extract_text_from_docx(file_bytes):
-    """Extract text from a DOCX file"""
+_W_P = qn('w:p')
+_W_T = qn('w:t')
+_W_R = qn('w:r')
+_XML_SPACE = qn('xml:space')
+
+def docx_paragraph_texts(doc):
+    """Text of each top-level body paragraph, read straight from the w:t nodes
+    (same paragraphs as doc.paragraphs, without building Paragraph/Run wrappers)"""
+    return [
+        ''.join(t.text or '' for t in p.iter(_W_T))
+        for p in doc.element.body.iterchildren(_W_P)
+    ]
+
+def _hash_file_bytes(file_bytes):
+    """Cheap cache key for uploaded file contents"""
+    return hashlib.blake2b(file_bytes, digest_size=16).digest()
+
+@st.cache_data(max_entries=32, show_spinner=False, hash_funcs={bytes: _hash_file_bytes})
+def read_docx(file_bytes):
+    """Parse a DOCX once and return (text, (paragraph_count, word_count, char_count))"""
     try:
-        doc = Document(BytesIO(file_bytes))
-        full_text = []
-        for para in doc.paragraphs:
-            full_text.append(para.text)
-        return '\n'.join(full_text)
+        paragraphs = docx_paragraph_texts(Document(BytesIO(file_bytes)))
     except Exception as e:
-        return f"Error reading DOCX file: {str(e)}"
+        return f"Error reading DOCX file: {str(e)}", (0, 0, 0)
+    text = '\n'.join(paragraphs)
+    return text, (len(paragraphs), len(text.split()), sum(map(len, paragraphs)))
 
+def extract_text_from_docx(file_bytes):
+    """Extract text from a DOCX file"""
+    return read_docx(file_bytes)[0]
+
+@st.cache_data(max_entries=32, show_spinner=False, hash_funcs={bytes: _hash_file_bytes})
 def extract_text_from_pdf(file_bytes):
     """Extract text from a PDF file"""
     try:
+        if PDFIUM_AVAILABLE:
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(file_bytes)
+                try:
+                    return '\n'.join(page.get_textpage().get_text_range() for page in pdf)
+                finally:
+                    pdf.close()
         pdf_reader = PyPDF2.PdfReader(BytesIO(file_bytes))
         full_text = []
         for page in pdf_reader.pages:
@@ -42,13 +82,14 @@ def extract_text_from_pdf(file_bytes):
 def get_document_stats(doc):
     """Get basic statistics from a Document object"""
     try:
-        paragraph_count = len(doc.paragraphs)
-        word_count = sum(len(p.text.split()) for p in doc.paragraphs)
-        char_count = sum(len(p.text) for p in doc.paragraphs)
-        return paragraph_count, word_count, char_count
+        paragraphs = docx_paragraph_texts(doc)
+        word_count = len('\n'.join(paragraphs).split())
+        char_count = sum(map(len, paragraphs))
+        return len(paragraphs), word_count, char_count
     except:
         return 0, 0, 0
 
+@st.cache_data(max_entries=32, show_spinner=False)
 def get_pdf_stats(text):
     """Get basic statistics from PDF text"""
     try:
@@ -58,12 +99,49 @@ def get_pdf_stats(text):
     except:
         return 0, 0, 0
 
+def extract_document(name, file_bytes):
+    """Text and stats for an uploaded file: (text, (paragraphs or lines, words, characters))"""
+    file_extension = os.path.splitext(name)[1].lower()
+    if file_extension == ".docx":
+        return read_docx(file_bytes)
+    if file_extension == ".pdf":
+        text = extract_text_from_pdf(file_bytes)
+        return text, get_pdf_stats(text)
+    return "Unsupported file type", (0, 0, 0)
+
+def extract_documents(files):
+    """Extract all uploaded files concurrently; returns [(text, stats)] in upload order
+
+    Results are positional, not keyed by name, since two uploads may share a file name.
+    DOCX files parse in parallel; PDFs still extract one at a time because every PDFium
+    call has to hold _PDFIUM_LOCK.
+    """
+    if not files:
+        return []
+    with ThreadPoolExecutor(max_workers=min(8, len(files))) as executor:
+        return list(executor.map(lambda f: extract_document(f.name, f.getvalue()), files))
+
 def create_document_from_text(text):
     """Create a Word document from text content"""
     doc = Document()
-    paragraphs = text.split('\n')
-    for para in paragraphs:
-        doc.add_paragraph(para)
+    body = doc.element.body
+    
+    # Build the <w:p><w:r><w:t> nodes directly (same XML add_paragraph produces for plain text)
+    new_paragraphs = []
+    for para in text.split('\n'):
+        p = body.makeelement(_W_P, {})
+        if para:
+            r = p.makeelement(_W_R, {})
+            t = r.makeelement(_W_T, {_XML_SPACE: 'preserve'})
+            t.text = para
+            r.append(t)
+            p.append(r)
+        new_paragraphs.append(p)
+    
+    # Paragraphs go before the trailing section properties, as add_paragraph inserts them
+    sect_pr = body.find(qn('w:sectPr'))
+    insert_at = body.index(sect_pr) if sect_pr is not None else len(body)
+    body[insert_at:insert_at] = new_paragraphs
     return doc
 
 def document_to_bytes(doc):
@@ -73,6 +151,11 @@ def document_to_bytes(doc):
     buffer.seek(0)
     return buffer
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_docx_bytes(text):
+    """DOCX file bytes for text; cached so reruns with unchanged text skip the rebuild"""
+    return document_to_bytes(create_document_from_text(text)).getvalue()
+
 def create_pdf_from_text(text):
     """Create a PDF document from text content"""
     buffer = BytesIO()
@@ -414,6 +497,9 @@ def render_write_prisoners():
             st.subheader("Document Cards")
             st.markdown("Click on any document card to view and edit its content.")
             
+            # Extract every file up front (in parallel), then render
+            extracted = extract_documents(uploaded_files)
+            
             # Create a grid of cards
             cols = st.columns(3)  # 3 columns for card grid
             
@@ -432,53 +518,48 @@ def render_write_prisoners():
                         st.caption(f"Size: {file_size_kb:.1f} KB")
                         
                         # Preview of document content (first 100 characters)
-                        file_bytes = file.getvalue()
-                        if file_extension == ".docx":
-                            preview_text = extract_text_from_docx(file_bytes)[:100] + "..."
-                        elif file_extension == ".pdf":
-                            preview_text = extract_text_from_pdf(file_bytes)[:100] + "..."
+                        if file_extension in (".docx", ".pdf"):
+                            preview_text = extracted[i][0][:100] + "..."
                         else:
                             preview_text = "Unsupported file type"
                         st.caption(f"Preview: {preview_text}")
                         
                         # Action button to select this document
-                        if st.button("View/Edit", key=f"select_{file.name}"):
+                        if st.button("View/Edit", key=f"select_{i}_{file.name}"):
                             st.session_state.selected_doc = file.name
+                            st.session_state.selected_doc_pos = i
                             st.rerun()
             
             # If a document is selected, show it in detail view
             if st.session_state.selected_doc:
-                # Find the selected file object
-                selected_file = next((f for f in uploaded_files if f.name == st.session_state.selected_doc), None)
+                # Find the selected file object (by card position, since names may repeat)
+                selected_pos = st.session_state.get("selected_doc_pos")
+                if not (
+                    selected_pos is not None and selected_pos < len(uploaded_files)
+                    and uploaded_files[selected_pos].name == st.session_state.selected_doc
+                ):
+                    selected_pos = next(
+                        (i for i, f in enumerate(uploaded_files) if f.name == st.session_state.selected_doc), None
+                    )
+                selected_file = uploaded_files[selected_pos] if selected_pos is not None else None
                 if selected_file:
                     st.markdown("---")
                     st.subheader(f"📄 {selected_file.name}")
                     
-                    # Extract text based on file type
-                    file_bytes = selected_file.getvalue()
+                    # Text and stats were extracted above
                     file_extension = os.path.splitext(selected_file.name)[1].lower()
-                    
-                    if file_extension == ".docx":
-                        text_content = extract_text_from_docx(file_bytes)
-                    elif file_extension == ".pdf":
-                        text_content = extract_text_from_pdf(file_bytes)
-                    else:
-                        text_content = "Unsupported file type"
+                    text_content, doc_stats = extracted[selected_pos]
                     
                     # Display stats
                     if file_extension == ".docx":
-                        try:
-                            doc = Document(BytesIO(file_bytes))
-                            p_count, w_count, c_count = get_document_stats(doc)
-                            
-                            col1, col2, col3 = st.columns(3)
-                            col1.metric("Paragraphs", p_count)
-                            col2.metric("Words", w_count)
-                            col3.metric("Characters", c_count)
-                        except:
-                            st.warning("Could not calculate document statistics")
+                        p_count, w_count, c_count = doc_stats
+                        
+                        col1, col2, col3 = st.columns(3)
+                        col1.metric("Paragraphs", p_count)
+                        col2.metric("Words", w_count)
+                        col3.metric("Characters", c_count)
                     elif file_extension == ".pdf":
-                        p_count, w_count, c_count = get_pdf_stats(text_content)
+                        p_count, w_count, c_count = doc_stats
                         
                         col1, col2, col3 = st.columns(3)
                         col1.metric("Lines", p_count)
@@ -513,8 +594,7 @@ def render_write_prisoners():
                     
                     if file_extension == ".docx":
                         # Create updated DOCX from edited content
-                        updated_doc = create_document_from_text(edited_content)
-                        updated_bytes = document_to_bytes(updated_doc)
+                        updated_bytes = build_docx_bytes(edited_content)
                         
                         col1, col2, col3 = st.columns(3)
                         col1.download_button(
@@ -546,8 +626,7 @@ def render_write_prisoners():
                     
                     else:  # PDF
                         # For PDFs, we can only save as text or convert to DOCX
-                        new_doc = create_document_from_text(edited_content)
-                        new_doc_bytes = document_to_bytes(new_doc)
+                        new_doc_bytes = build_docx_bytes(edited_content)
                         
                         col1, col2 = st.columns(2)
                         col1.download_button(
@@ -606,8 +685,7 @@ def render_write_prisoners():
         st.markdown(st.session_state.doc_content)
         
         # Create document from content
-        doc = create_document_from_text(st.session_state.doc_content)
-        doc_bytes = document_to_bytes(doc)
+        doc_bytes = build_docx_bytes(st.session_state.doc_content)
         
         # Download buttons
         st.markdown("---")
@@ -0,0 +1,163 @@
+# services/name_matching.py
+
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _rows_containing(buf, offsets, needle):
+        """Mask of the packed names (buf[offsets[i]:offsets[i+1]]) that contain needle."""
+        n_rows = len(offsets) - 1
+        m = len(needle)
+        out = np.zeros(n_rows, dtype=np.bool_)
+        for row in range(n_rows):
+            for i in range(offsets[row], offsets[row + 1] - m + 1):
+                j = 0
+                while j < m and buf[i + j] == needle[j]:
+                    j += 1
+                if j == m:
+                    out[row] = True
+                    break
+        return out
+
+
+# Name-like OCR tokens: a letter followed by 2+ letters, hyphens or apostrophes
+_TOKEN_RE = re.compile(r"\b[A-Za-z][A-Za-z'\-]{2,}\b")
+
+# Common words and envelope boilerplate that are never worth scanning lName for.
+# Words that are also common surnames (e.g. "may", "young", "little") are left out.
+_STOPWORDS = frozenset("""
+    the and for are but not you all any can had her was one our out has him his how its
+    who did get she too use that with have this from they will would there their what
+    about which when make like time just know take into your some could them than then
+    now only come over also back after two well even want because these give most been
+    were said each other such here where does done should while very both same being
+    under again further once off own why those through during before above below
+    between until upon onto within without against among per via
+    mrs inmate prisoner name number box street ave avenue road
+    blvd drive lane suite apt unit pobox mail mailing legal usps postage
+    first class priority return sender dept department state prison facility
+    correctional corrections institution cdcr cdc housing bldg building bed cell
+    california city county united states usa zip code
+""".split())
+
+# Substring scanners for the partial-match step, fastest first; all give the same masks
+SCAN_METHODS = ('ahocorasick', 'numba', 'pandas')
+
+
+def name_tokens(text: str) -> list:
+    """Lowercase name-like tokens of the text, deduped in reading order, without stopwords."""
+    return [
+        word for word in dict.fromkeys(token.lower() for token in _TOKEN_RE.findall(text))
+        if word not in _STOPWORDS
+    ]
+
+
+def available_scan_methods() -> list:
+    """The entries of SCAN_METHODS whose optional dependency is installed."""
+    installed = {'ahocorasick': AHOCORASICK_AVAILABLE, 'numba': NUMBA_AVAILABLE, 'pandas': True}
+    return [method for method in SCAN_METHODS if installed[method]]
+
+
+class LastNameMatcher:
+    """
+    Finds the rows whose last name matches a word of OCR text.
+
+    A token that is exactly someone's last name wins outright; only when no
+    token is does the matcher fall back to rows whose last name contains a
+    token. Build one per dataset: the column is lowered and packed once.
+    """
+
+    def __init__(self, lnames: pd.Series):
+        self.labels = lnames.index
+        lower = lnames.fillna('').astype(str).str.strip().str.lower()
+        self._names = lower.tolist()
+
+        self._rows_by_name = {}
+        for pos, name in enumerate(self._names):
+            if name:
+                self._rows_by_name.setdefault(name, []).append(pos)
+
+        # Built on first use by the scanner that needs them
+        self._lower = None
+        self._packed = None
+
+    def match(self, text: str, method: str = None) -> list:
+        """Return the index labels of the matching rows (exact matches first, in token order)."""
+        words = name_tokens(text)
+        if not words:
+            return []
+
+        # Exact last names are a hash lookup; the column is only scanned when none hit
+        exact = [pos for word in words for pos in self._rows_by_name.get(word, ())]
+        if exact:
+            return self.labels[exact].tolist()
+
+        method = method or available_scan_methods()[0]
+        if method not in available_scan_methods():
+            raise ValueError(f"Scan method not available: {method}")
+
+        hit_counts = np.zeros(len(self._names), dtype=np.int32)
+        for mask in getattr(self, f"_{method}_masks")(words):
+            hit_counts += mask
+            # Two different tokens landing on the same row is a confident match; stop scanning
+            if hit_counts.max() >= 2:
+                break
+        return self.labels[hit_counts > 0].tolist()
+
+    def _ahocorasick_masks(self, words):
+        # The tokens go into the automaton; one pass over the joined column then
+        # finds every (token, row) pair. "\n" never occurs in a token, so no hit
+        # spans two names.
+        automaton = ahocorasick.Automaton()
+        for i, word in enumerate(words):
+            automaton.add_word(word, i)
+        automaton.make_automaton()
+
+        joined = '\n'.join(self._names)
+        starts = np.cumsum([0] + [len(name) + 1 for name in self._names[:-1]])
+        masks = np.zeros((len(words), len(self._names)), dtype=bool)
+        for end, i in automaton.iter(joined):
+            masks[i, np.searchsorted(starts, end, side='right') - 1] = True
+        return iter(masks)
+
+    def _numba_masks(self, words):
+        if self._packed is None:
+            encoded = [name.encode('utf-8') for name in self._names]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(name) for name in encoded], out=offsets[1:])
+            self._packed = np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+        buf, offsets = self._packed
+        for word in words:
+            yield _rows_containing(buf, offsets, np.frombuffer(word.encode('utf-8'), dtype=np.uint8))
+
+    def _pandas_masks(self, words):
+        if self._lower is None:
+            # Arrow-backed for native substring tests
+            self._lower = pd.Series(self._names, dtype='string[pyarrow]')
+
+        # One alternation pass over the whole column finds every row any token hits;
+        # the per-token tests below then only touch those candidate rows
+        pattern = '|'.join(re.escape(word) for word in words)
+        candidates = np.flatnonzero(self._lower.str.contains(pattern, regex=True).to_numpy(dtype=bool))
+        candidate_ln = self._lower.iloc[candidates]
+        for word in words:
+            # Plain substring test (no regex engine) over the pre-lowered candidates
+            mask = np.zeros(len(self._names), dtype=bool)
+            mask[candidates] = candidate_ln.str.contains(word, regex=False).to_numpy(dtype=bool)
+            yield mask
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the app packages (core, utils, ...) from the project root
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
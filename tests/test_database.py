@@ -0,0 +1,20 @@
+"""Prisoner workbook helpers in core.database."""
+import os
+
+import pandas as pd
+import pytest
+
+from core.database import save_data
+
+pytest.importorskip("openpyxl")
+
+
+def test_save_data_keeps_the_newest_frame(tmp_path):
+    path = str(tmp_path / "prisoners.xlsx")
+    writers = [save_data(pd.DataFrame({'lName': ['Doe'], 'version': [i]}), path) for i in range(8)]
+    for writer in writers:
+        writer.join()
+
+    assert pd.read_excel(path)['version'].tolist() == [7]
+    # Every temp file was either swapped into place or removed
+    assert os.listdir(tmp_path) == ["prisoners.xlsx"]
@@ -0,0 +1,190 @@
+"""LetterDatabase behaviour on a throwaway SQLite file."""
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+from core.letter_db import LetterDatabase
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+RECORD = {'fName': 'John', 'lName': 'Doe', 'CDCRno': 'A123456'}
+OTHER_RECORD = {'fName': 'Mary', 'lName': 'Major', 'CDCRno': 'B765432'}
+OCR_DATA = {'full_text': 'Dear friend', 'return_address': 'John Doe\nPO Box 1'}
+
+# CPID wins; a missing or blank CPID falls back to the legacy code column
+PRISONERS = pd.DataFrame(
+    {'CPID': ['NEW001', None, '  ', 'KEEP01'], 'code': ['x', 'OLD002', 'CODE03', 'y']},
+    index=[0, 1, 2, 3],
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return LetterDatabase(str(tmp_path / "letters.db"))
+
+
+def test_reassign_letter_without_cpid_uses_legacy_code(db):
+    letter_id = db.add_letter(1, RECORD, OCR_DATA, "/tmp/env.png", prisoner_code="ABC123")
+
+    db.reassign_letter(letter_id, prisoner_idx=2, prisoner_record=OTHER_RECORD,
+                       prisoner_code=None, old_prisoner_idx=1)
+
+    letter = db.get_letter_by_id(letter_id)
+    assert letter['prisoner_idx'] == 2
+    assert letter['prisoner_code'] == db.legacy_prisoner_code(OTHER_RECORD)
+
+
+def test_reassign_letter_keeps_given_cpid(db):
+    letter_id = db.add_letter(1, RECORD, OCR_DATA, "/tmp/env.png", prisoner_code="ABC123")
+
+    db.reassign_letter(letter_id, prisoner_idx=2, prisoner_record=OTHER_RECORD, prisoner_code="XYZ789")
+
+    letter = db.get_letter_by_id(letter_id)
+    assert (letter['prisoner_idx'], letter['prisoner_code']) == (2, "XYZ789")
+
+
+def test_readers_do_not_see_uncommitted_writes(db):
+    db.add_letter(1, RECORD, OCR_DATA, "/tmp/env.png", prisoner_code="ABC123")
+    inserted, release = threading.Event(), threading.Event()
+
+    def writer():
+        with db._transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO letters (prisoner_idx, prisoner_code) VALUES (?, ?)", (2, "DEF456")
+            )
+            inserted.set()
+            release.wait(timeout=10)
+            raise RuntimeError("roll back")
+
+    def rolled_back_writer():
+        with pytest.raises(RuntimeError):
+            writer()
+
+    thread = threading.Thread(target=rolled_back_writer)
+    thread.start()
+    try:
+        assert inserted.wait(timeout=10)
+        assert [row['prisoner_code'] for row in db.get_letters_page()] == ["ABC123"]
+        assert len(db.get_all_letters()) == 1
+    finally:
+        release.set()
+        thread.join()
+    assert db.count_letters() == 1
+
+
+def test_letter_db_imports_without_streamlit():
+    # core stays independent of the UI; the st.cache_resource factory lives in utils
+    code = "import sys; sys.modules['streamlit'] = None; import core.letter_db"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, check=True)
+
+
+def test_raw_ocr_save_failure_is_logged(db, caplog):
+    with caplog.at_level(logging.WARNING, logger="core.letter_db"):
+        assert db._save_raw_ocr(7, {"response": object()}) is None
+    assert "Could not save raw OCR for letter 7" in caplog.text
+
+
+def test_migration_rewrites_legacy_dates_once(tmp_path):
+    path = str(tmp_path / "letters.db")
+    letter_id = LetterDatabase(path).add_letter(1, RECORD, OCR_DATA, "/tmp/env.png", prisoner_code="ABC123")
+    # Roll the file back to a pre-ISO database: 21Sep2025 dates and user_version 0
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "UPDATE letters SET date_env_letter_scanned = '21Sep2025', date_letter_postmarked = '05Jan2024',"
+            " date_picked_up_po = NULL WHERE letter_id = ?", (letter_id,)
+        )
+        conn.execute("PRAGMA user_version = 0")
+    conn.close()
+
+    letter = LetterDatabase(path).get_letter_by_id(letter_id)
+    assert letter['date_env_letter_scanned'] == "2025-09-21"
+    assert letter['date_letter_postmarked'] == "2024-01-05"
+    assert letter['date_picked_up_po'] is None
+
+    # Already at SCHEMA_VERSION: reopening must not scan the table again
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == LetterDatabase.SCHEMA_VERSION
+        conn.execute("UPDATE letters SET date_letter_postmarked = '05Jan2024' WHERE letter_id = ?", (letter_id,))
+    conn.close()
+    assert LetterDatabase(path).get_letter_by_id(letter_id)['date_letter_postmarked'] == "05Jan2024"
+
+
+def test_resolve_prisoner_codes_falls_back_to_code():
+    codes = LetterDatabase.resolve_prisoner_codes(PRISONERS)
+    assert codes.to_dict() == {0: 'NEW001', 1: 'OLD002', 2: 'CODE03', 3: 'KEEP01'}
+
+
+def test_sync_prisoner_codes_updates_only_changed_rows(db):
+    ids = {
+        idx: db.add_letter(idx, RECORD, OCR_DATA, "/tmp/env.png", prisoner_code=code)
+        for idx, code in [(0, "ABC123"), (1, "ABC123"), (2, "CODE03"), (3, "KEEP01"), (9, "ZZZ999")]
+    }
+
+    assert db.sync_prisoner_codes_from_df(PRISONERS) == 2
+    codes = {idx: db.get_letter_by_id(letter_id)['prisoner_code'] for idx, letter_id in ids.items()}
+    # prisoner_idx 9 is not in the frame and keeps its code
+    assert codes == {0: 'NEW001', 1: 'OLD002', 2: 'CODE03', 3: 'KEEP01', 9: 'ZZZ999'}
+
+    assert db.sync_prisoner_codes_from_df(PRISONERS) == 0
+    # Labels that cannot be a prisoner_idx match nothing
+    assert db.sync_prisoner_codes_from_df(PRISONERS.set_index(pd.Index(list("abcd")))) == 0
+
+
+def test_sync_prisoner_codes_is_one_transaction(db):
+    first = db.add_letter(0, RECORD, OCR_DATA, "/tmp/env.png", prisoner_code="ABC123")
+    second = db.add_letter(1, RECORD, OCR_DATA, "/tmp/env.png", prisoner_code="ABC123")
+    with db._transaction() as cursor:
+        cursor.execute('''
+            CREATE TRIGGER fail_second BEFORE UPDATE OF prisoner_code ON letters
+            WHEN NEW.prisoner_idx = 1 BEGIN SELECT RAISE(ABORT, 'boom'); END
+        ''')
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.sync_prisoner_codes_from_df(PRISONERS)
+    # The row updated before the failure is rolled back with it
+    assert [db.get_letter_by_id(i)['prisoner_code'] for i in (first, second)] == ["ABC123", "ABC123"]
+
+
+def test_add_letters_bulk(db):
+    raw = {'responses': [{'fullTextAnnotation': {'text': 'Dear friend'}}]}
+    ids = db.add_letters_bulk([
+        (0, RECORD, dict(OCR_DATA, raw_response=raw), "/tmp/a.png", "ABC123"),
+        (1, OTHER_RECORD, OCR_DATA, "/tmp/b.png", None),
+        (2, RECORD, {}, "/tmp/c.png", "DEF456"),
+    ])
+
+    assert len(ids) == 3 and ids == sorted(ids)
+    letters = [db.get_letter_by_id(letter_id) for letter_id in ids]
+    assert [(l['prisoner_idx'], l['envelope_image_path']) for l in letters] == [
+        (0, "/tmp/a.png"), (1, "/tmp/b.png"), (2, "/tmp/c.png")
+    ]
+    assert [l['prisoner_code'] for l in letters] == ["ABC123", db.legacy_prisoner_code(OTHER_RECORD), "DEF456"]
+    assert letters[2]['ocr_text'] == ""
+
+    # The raw response goes to a gzip'd sidecar file, not into the row
+    assert db.get_raw_ocr(ids[0]) == raw
+    assert db.get_raw_ocr(ids[1]) is None
+
+    cursor = db._read_conn().cursor()
+    cursor.execute("SELECT letter_id FROM audit_log WHERE action = 'letter_added' ORDER BY letter_id")
+    assert [row[0] for row in cursor.fetchall()] == ids
+
+
+def test_letters_page_order_is_stable_across_pages(db):
+    ids = db.add_letters_bulk([(idx, RECORD, OCR_DATA, "/tmp/env.png", "ABC123") for idx in range(5)])
+    # Letters scanned the same day tie on the date; letter_id breaks the tie
+    dates = ["2025-09-20", "2025-09-21", "2025-09-21", "2025-09-21", "2025-09-19"]
+    for letter_id, date in zip(ids, dates):
+        db.update_letter_field(letter_id, 'date_env_letter_scanned', date)
+
+    pages = [db.get_letters_page(offset, limit=2) for offset in (0, 2, 4)]
+    assert [row['letter_id'] for page in pages for row in page] == [ids[3], ids[2], ids[1], ids[0], ids[4]]
+
+    with pytest.raises(ValueError):
+        db.get_letters_page(columns=('letter_id', 'not_a_column'))
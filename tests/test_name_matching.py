@@ -0,0 +1,40 @@
+"""Every substring scanner behind LastNameMatcher must give the same matches."""
+import pandas as pd
+import pytest
+
+from services.name_matching import SCAN_METHODS, LastNameMatcher, available_scan_methods, name_tokens
+
+LNAMES = pd.Series(
+    ["Garcia", "Johnson", "Johnston", "O'Brien", "Smith-Jones", None, "  Lee ", "Ng", "State"],
+    index=[10, 11, 12, 13, 14, 15, 16, 17, 18],
+)
+
+OCR_TEXTS = {
+    # "state" is a last name here but also envelope boilerplate, so it never matches
+    "exact": "INMATE MAIL\nJohn GARCIA K12345\nCalifornia State Prison\nPO Box 99, Lee",
+    "partial": "Mr. Johns\nHousing B-12\nBrien, Sacramento",
+    # Two tokens hit Smith-Jones, so the scan stops before "garc" can reach Garcia
+    "partial_early_stop": "smith jones garc",
+    "none": "The return sender of this mail",
+}
+
+EXPECTED = {
+    "exact": [10, 16],
+    "partial": [11, 12, 13],
+    "partial_early_stop": [14],
+    "none": [],
+}
+
+
+def test_tokens_skip_stopwords_and_short_words():
+    assert name_tokens("Ng, the STATE PRISON of Garcia garcia") == ["garcia"]
+
+
+@pytest.mark.parametrize("method", SCAN_METHODS)
+@pytest.mark.parametrize("case", sorted(OCR_TEXTS))
+def test_scan_methods_agree(method, case):
+    if method not in available_scan_methods():
+        pytest.skip(f"{method} is not installed")
+    matcher = LastNameMatcher(LNAMES)
+    assert matcher.match(OCR_TEXTS[case], method=method) == EXPECTED[case]
+    assert matcher.match(OCR_TEXTS[case], method=method) == matcher.match(OCR_TEXTS[case], method="pandas")
@@ -0,0 +1,70 @@
+"""Multi-image OCR in core.ocr, against a fake Vision client."""
+import io
+
+import pytest
+
+vision = pytest.importorskip("google.cloud.vision")
+
+from core import ocr  # noqa: E402
+
+
+class FakeVisionClient:
+    """Answers each image with its own bytes as the detected text."""
+
+    def __init__(self):
+        self.requests = 0
+        self.batch_sizes = []
+
+    @staticmethod
+    def _response(content):
+        return vision.AnnotateImageResponse(
+            text_annotations=[vision.EntityAnnotation(description=content.decode())]
+        )
+
+    def text_detection(self, image, retry=None):
+        self.requests += 1
+        return self._response(image.content)
+
+    def batch_annotate_images(self, requests, retry=None):
+        self.requests += 1
+        self.batch_sizes.append(len(requests))
+        return vision.BatchAnnotateImagesResponse(
+            responses=[self._response(request.image.content) for request in requests]
+        )
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    fake = FakeVisionClient()
+    monkeypatch.setattr(ocr, "_client", fake)
+    monkeypatch.setattr(ocr, "OCR_CACHE_DIR", str(tmp_path))
+    ocr._load_cached_result.cache_clear()
+    return fake
+
+
+def test_extract_text_from_images_keeps_input_order(client):
+    images = [f"Envelope {i}\nSacramento CA 9581{i}".encode() for i in range(5)]
+
+    results = ocr.extract_text_from_images([io.BytesIO(content) for content in images])
+
+    assert [result['full_text'] for result in results] == [content.decode() for content in images]
+    assert results[0]['return_address'] == "Envelope 0\nSacramento CA 95810"
+
+
+def test_extract_text_from_images_serves_repeats_from_cache(client):
+    images = [b"John Doe\nPO Box 1", b"Mary Major\nPO Box 2"]
+    ocr.extract_text_from_images([io.BytesIO(content) for content in images])
+    first_pass = client.requests
+
+    ocr.extract_text_from_images([io.BytesIO(content) for content in images])
+
+    assert client.requests == first_pass
+
+
+def test_extract_text_from_images_batches_sixteen_per_request(client):
+    images = [f"Envelope {i}".encode() for i in range(40)]
+
+    results = ocr.extract_text_from_images([io.BytesIO(content) for content in images])
+
+    assert sorted(client.batch_sizes) == [8, 16, 16]
+    assert [result['full_text'] for result in results] == [content.decode() for content in images]
@@ -0,0 +1,17 @@
+"""Smoke tests: each page script must at least import and render without raising."""
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_write_prisoners_page_runs():
+    pytest.importorskip("docx")
+    pytest.importorskip("reportlab")
+    at = AppTest.from_file(os.path.join(ROOT_DIR, "pages", "Write_Prisoners.py"), default_timeout=30)
+    at.run()
+    assert not at.exception
@@ -0,0 +1,40 @@
+"""Workbook parsing and the Parquet sidecar round trip."""
+import os
+
+import pandas as pd
+import pytest
+
+from core.database import (
+    normalize_mixed_columns, parse_workbook, read_parquet_sidecar, write_parquet_sidecar
+)
+
+pytest.importorskip("pyarrow")
+
+WORKBOOK = os.path.join(os.path.dirname(__file__), "..", "prisoner_21Sep2025.xlsx")
+
+
+@pytest.fixture(scope="module")
+def workbook_bytes():
+    with open(WORKBOOK, "rb") as f:
+        return f.read()
+
+
+def test_parquet_sidecar_round_trips_bundled_workbook(workbook_bytes, tmp_path):
+    cold = normalize_mixed_columns(parse_workbook(workbook_bytes))
+    path = str(tmp_path / "cache" / "workbook.parquet")
+    write_parquet_sidecar(cold, path)
+
+    warm = read_parquet_sidecar(path)
+
+    pd.testing.assert_frame_equal(cold, warm, check_dtype=True)
+
+
+def test_text_columns_are_arrow_backed_after_warm_load(workbook_bytes, tmp_path):
+    path = str(tmp_path / "workbook.parquet")
+    write_parquet_sidecar(normalize_mixed_columns(parse_workbook(workbook_bytes)), path)
+
+    warm = read_parquet_sidecar(path)
+
+    for col in ('fName', 'lName', 'CPID'):
+        assert isinstance(warm[col].dtype, pd.StringDtype)
+        assert warm[col].dtype.storage == 'pyarrow'
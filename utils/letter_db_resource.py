@@ -0,0 +1,9 @@
+import streamlit as st
+
+from core.letter_db import LetterDatabase
+
+
+@st.cache_resource
+def get_letter_db():
+    """Process-wide LetterDatabase shared by every session and page"""
+    return LetterDatabase()
@@ -0,0 +1,45 @@
+"""
+Shared CSS for Streamlit pages
+"""
+import streamlit as st
+
+
+APP_CSS = """
+<style>
+    .main-header {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white;
+        padding: 20px;
+        border-radius: 10px;
+        text-align: center;
+        margin-bottom: 30px;
+    }
+    .section-header {
+        color: #444;
+        border-bottom: 2px solid #667eea;
+        padding-bottom: 5px;
+        margin-bottom: 15px;
+    }
+    .success-box {
+        padding: 10px;
+        background-color: #d4edda;
+        border: 1px solid #c3e6cb;
+        border-radius: 5px;
+        margin: 10px 0;
+    }
+    .error-box {
+        padding: 10px;
+        background-color: #f8d7da;
+        border: 1px solid #f5c6cb;
+        border-radius: 5px;
+        margin: 10px 0;
+    }
+</style>
+"""
+
+
+def inject_css():
+    """
+    Inject the app-wide CSS (header and section styles) into the current page.
+    """
+    st.markdown(APP_CSS, unsafe_allow_html=True)